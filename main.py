@@ -1,17 +1,26 @@
 from bokeh.io import curdoc
 
+import src.datastore
 from src.datamodel import DataModel
 from src.dash_sep import SeparationDash
+from src.helpers import load_loading_page
 
 doc = curdoc()
 
-model = DataModel(doc)
+if not src.datastore.wait_ready(0):
+    # Dataset still loading, or failed to load
+    doc.template = load_loading_page()
+    doc.template_variables['failed'] = src.datastore.LOAD_ERROR is not None
+else:
+    model = DataModel(doc)
 
-sep_dash = SeparationDash(model)
+    sep_dash = SeparationDash(model)
 
-model.callback_link_sep(sep_dash)
+    model.callback_link_sep(sep_dash)
 
-doc.add_root(sep_dash.dsel_widgets)
-doc.add_root(sep_dash.process)
-doc.add_root(sep_dash.kpi_plots)
-doc.add_root(sep_dash.detail_plots)
+    doc.on_session_destroyed(model.close)
+
+    doc.add_root(sep_dash.dsel_widgets)
+    doc.add_root(sep_dash.process)
+    doc.add_root(sep_dash.kpi_plots)
+    doc.add_root(sep_dash.detail_plots)
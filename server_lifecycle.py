@@ -1,23 +1,38 @@
+import asyncio
 from threading import Thread
 
 import src.datastore
 
 
+def load():
+    ''' Load the data, then start any processes which compute with it. '''
+    src.datastore.load()
+    src.datastore.start_pool()
+
+
 def on_server_loaded(server_context):
     ''' If present, this function is called when the server first starts. '''
-    t = Thread(target=src.datastore.load, args=())
+    src.datastore.open_isotherms()
+    src.datastore.start_prefetcher()
+    t = Thread(target=load, args=())
     t.setDaemon(True)
     t.start()
 
 
 def on_server_unloaded(server_context):
     ''' If present, this function is called when the server shuts down. '''
-    pass
+    src.datastore.stop_pool()
+    src.datastore.close_isotherms()
+    src.datastore.close_results()
 
 
-def on_session_created(session_context):
+async def on_session_created(session_context):
     ''' If present, this function is called when a session is created. '''
-    pass
+    # Wait for the dataset off the event loop, the page shows
+    # a loading message if it is still not ready after the timeout
+    if not src.datastore.READY.is_set():
+        await asyncio.get_event_loop().run_in_executor(
+            None, src.datastore.wait_ready, src.datastore.READY_TIMEOUT)
 
 
 def on_session_destroyed(session_context):
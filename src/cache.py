@@ -0,0 +1,146 @@
+"""
+Process-wide caching of computed results.
+
+Results are shared by every session served by the process, so cached
+objects must be treated as read-only by their users.
+"""
+import sys
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+
+
+def nbytes(obj):
+    """Approximate in-memory size of a cached result."""
+    if obj is None:
+        return 0
+    if hasattr(obj, 'memory_usage'):
+        usage = obj.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    return sys.getsizeof(obj)
+
+
+class ResultCache():
+    """
+    Thread-safe LRU cache bounded by the total size of its entries.
+
+    Concurrent misses on the same key are collapsed: the first caller
+    computes the result while the others wait for it.
+    """
+
+    def __init__(self, max_bytes, sizeof=nbytes):
+
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._pending = {}              # key -> Future
+        self._lock = Lock()
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collapsed = 0              # misses that waited on another
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return a cached value, marking it as recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Return a cached value without touching order or counters."""
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][0]
+            return default
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries."""
+        size = self.sizeof(value)
+        with self._lock:
+            self._store(key, value, size)
+
+    def get_or_compute(self, key, func):
+        """Return the cached value for key, or compute it with `func()`."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._pending[key] = Future()
+            else:
+                self.collapsed += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = func()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        size = self.sizeof(value)
+        with self._lock:
+            del self._pending[key]
+            self._store(key, value, size)
+        future.set_result(value)
+        return value
+
+    def keys(self):
+        """Cached keys, from least to most recently used."""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'collapsed': self.collapsed,
+            }
+
+    def _store(self, key, value, size):
+        """Insert an entry and evict down to the size limit (locked)."""
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.bytes -= old_size
+            self.evictions += 1
@@ -0,0 +1,198 @@
+"""
+Precomputed KPI cube.
+
+The KPI dataset is indexed offline by (adsorbate, isotherm type, integer
+temperature bin, material) cell. For each (adsorbate, type) pair the
+cells are ordered by temperature bin, so a temperature window maps to a
+single slice found with `searchsorted` instead of a scan of the dataset.
+
+The cube holds the dataset row positions of each cell rather than
+per-cell statistics, since the statistics of a window are not those of
+its cells combined. It does not copy the rows either: the positions are
+taken from the dataset when a window is queried. It is the only index of
+the dataset, used for KPI, isotherm and incremental selections alike.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.snapshot import source_digest
+from src.statistics import group_kpi, join_kpi, pair_kpi
+
+CELL_KEYS = ['ads', 'type', 't_bin', 'mat']
+
+
+class KPICube():
+    """
+    Dataset rows grouped into (ads, type, temperature bin, mat) cells.
+
+    `positions` holds the row positions of `data` sorted by cell, and in
+    dataset order within a cell. `cells` lists each cell with its
+    [start, stop) range of `positions`. `source` is the content hash of
+    the dataset file the cube was built from, if known.
+    """
+
+    def __init__(self, data, positions, cells, source=None):
+
+        self.data = data
+        self.positions = positions
+        self.cells = cells
+        self.source = source
+        self.t = data['t'].to_numpy()
+        self.types = list(cells['type'].unique())
+
+        # Approximate statistics, see `build_sketches`
+        self.sketches = None
+
+        # Per (ads, type) temperature bins and the cells they span
+        self._blocks = {}
+        for key, block in cells.groupby(
+                ['ads', 'type'], sort=False, observed=True):
+            self._blocks[key] = (
+                block['t_bin'].to_numpy(),
+                block.index.to_numpy(),
+            )
+
+    @property
+    def nbytes(self):
+        """Memory held by the cube, on top of the dataset."""
+        # `t` is a view of the dataset column
+        return self.positions.nbytes + \
+            int(self.cells.memory_usage(deep=True).sum())
+
+    @classmethod
+    def from_frame(cls, data, source=None):
+        """Build the cube of the KPI dataset."""
+        t_bin = np.floor(data['t'].to_numpy()).astype(int)
+        codes = [pd.factorize(data[key], sort=True)[0]
+                 for key in ('ads', 'type', 'mat')]
+        # Stable, so rows of a cell stay in dataset order
+        positions = np.lexsort((codes[2], t_bin, codes[1], codes[0]))
+
+        keys = np.stack(
+            (codes[0], codes[1], t_bin, codes[2]), axis=1)[positions]
+        change = (keys[1:] != keys[:-1]).any(axis=1)
+        start = np.flatnonzero(np.concatenate(([True], change)))
+        stop = np.append(start[1:], len(positions))
+
+        # Categorical keys of a compact dataset stay categorical
+        first = positions[start]
+        cells = pd.DataFrame({
+            key: data[key].iloc[first].reset_index(drop=True)
+            for key in ('ads', 'type', 'mat')
+        })
+        cells['t_bin'] = t_bin[first]
+        cells['start'] = start
+        cells['stop'] = stop
+        cells = cells[CELL_KEYS + ['start', 'stop']]
+
+        return cls(data, positions, cells, source)
+
+    @classmethod
+    def read(cls, path, data):
+        """
+        Read a cube written with `write`, for the rows of `data`.
+
+        Returns None if the file is in an older format or does not match
+        the number of rows of `data`.
+        """
+        try:
+            positions = pd.read_hdf(path, 'positions').to_numpy()
+            cells = pd.read_hdf(path, 'cells')
+            source = pd.read_hdf(path, 'source')
+        except KeyError:
+            return None
+        if len(positions) != len(data):
+            return None
+        source = source.iloc[0] if len(source) else None
+        return cls(data, positions, cells, source or None)
+
+    def write(self, path):
+        """Save the cube in a HDF5 file, with the hash of its source."""
+        pd.Series(self.positions).to_hdf(path, key='positions', mode='w')
+        self.cells.to_hdf(path, key='cells', mode='a')
+        pd.Series([self.source or ''], dtype=object).to_hdf(
+            path, key='source', mode='a')
+
+    def cell_ids(self, i_type, t_abs, t_tol, ads):
+        """Cells of an adsorbate in the temperature bins of a window."""
+        b_low, b_high = np.floor(t_abs - t_tol), np.floor(t_abs + t_tol)
+
+        ids = []
+        for typ in ([i_type] if i_type else self.types):
+            if (ads, typ) not in self._blocks:
+                continue
+            bins, cells = self._blocks[(ads, typ)]
+            first = np.searchsorted(bins, b_low, side='left')
+            last = np.searchsorted(bins, b_high, side='right')
+            ids.append(cells[first:last])
+
+        return np.concatenate(ids) if ids else np.arange(0)
+
+    def window(self, i_type, t_abs, t_tol, ads):
+        """
+        Dataset row positions of an adsorbate in a temperature window.
+
+        Positions are in dataset order, so that selections are
+        interchangeable with boolean-mask filtering.
+        """
+        t_low, t_high = t_abs - t_tol, t_abs + t_tol
+
+        # Cells of consecutive bins are stored next to each other
+        positions = []
+        for typ in ([i_type] if i_type else self.types):
+            cells = self.cell_ids(typ, t_abs, t_tol, ads)
+            if len(cells):
+                positions.append(self.positions[
+                    self.cells['start'].iat[cells[0]]:
+                    self.cells['stop'].iat[cells[-1]]])
+
+        rows = np.sort(np.concatenate(positions)) if positions \
+            else np.arange(0)
+
+        # Only the edge bins can hold rows outside the exact window
+        t = self.t[rows]
+        return rows[(t >= t_low) & (t <= t_high)]
+
+    def query(self, i_type, t_abs, t_tol, ads):
+        """Gather the KPI rows of an adsorbate in a temperature window."""
+        return self.data.iloc[self.window(i_type, t_abs, t_tol, ads)]
+
+    def build_sketches(self, k=64):
+        """Summarise every cell in quantile sketches of size `k`."""
+        from src.sketch import KPISketches
+        self.sketches = KPISketches.from_cube(self, k)
+
+    def select_data(self, i_type, t_abs, t_tol, g1, g2, engine='numpy'):
+        """
+        Cube equivalent of `src.statistics.select_data`.
+
+        The 'sketch' engine merges the cell sketches instead of reading
+        KPI rows, see `src.sketch` for its accuracy.
+        """
+        if engine == 'sketch':
+            return join_kpi(
+                self.select_data_single(i_type, t_abs, t_tol, g1, engine),
+                self.select_data_single(i_type, t_abs, t_tol, g2, engine))
+        return pair_kpi(
+            self.query(i_type, t_abs, t_tol, g1),
+            self.query(i_type, t_abs, t_tol, g2),
+            engine)
+
+    def select_data_single(self, i_type, t_abs, t_tol, g1, engine='numpy'):
+        """Cube equivalent of `src.statistics.select_data_single`."""
+        if engine == 'sketch':
+            if self.sketches is None:
+                self.build_sketches()
+            return self.sketches.kpi(self.cell_ids(i_type, t_abs, t_tol, g1))
+        return group_kpi(self.query(i_type, t_abs, t_tol, g1), engine)
+
+
+if __name__ == '__main__':
+    from src.helpers import load_data, kpi_source
+
+    path = Path.cwd() / 'data' / 'kpi-cube.h5'
+    KPICube.from_frame(
+        load_data(snapshot=False), source_digest(kpi_source)).write(path)
+    print(f'KPI cube written to {path}.')
@@ -8,6 +8,7 @@ from bokeh.models.widgets import (
 )
 from bokeh.models.widgets.tables import DataTable, TableColumn, NumberFormatter
 from bokeh.models.callbacks import CustomJS
+from bokeh.models.sources import CDSView
 from bokeh.models.markers import Circle
 from bokeh.models.annotations import ColorBar, LabelSet, Slope
 from bokeh.models.tools import HoverTool, TapTool
@@ -16,6 +17,7 @@ from bokeh.transform import log_cmap
 from bokeh.palettes import viridis as gen_palette
 
 from src.helpers import load_tooltip, load_details, load_details_js
+from src.helpers import load_hover_js
 
 
 class SeparationDash():
@@ -39,7 +41,7 @@ class SeparationDash():
         self.process = Button(
             label="Generate", button_type="primary",
             name='process', sizing_mode='scale_width', css_classes=['generate'])
-        self.process.js_on_click(CustomJS(code="toggleLoading()"))
+        self.process.js_on_click(CustomJS(code="showLoading()"))
 
         ################################
         # Widgets
@@ -174,6 +176,13 @@ class SeparationDash():
                         title=title)
         fig_dict.update(kwargs)
 
+        # Draw the level of detail chosen by the model, with WebGL
+        rend_dict = {}
+        if ind in self.model.lod_filters:
+            fig_dict['output_backend'] = 'webgl'
+            rend_dict['view'] = CDSView(
+                source=d_source, filters=[self.model.lod_filters[ind]])
+
         # Create a colour mapper for number of isotherms
         mapper = log_cmap(
             field_name='{0}_n'.format(ind), palette="Viridis256",
@@ -183,10 +192,15 @@ class SeparationDash():
         # Create a new plot
         graph = figure(**fig_dict)
 
-        # Add the hover tooltip
+        # Add the hover tooltip, which also reports materials to prefetch
+        hover_dict = {}
+        if self.model.hovered is not None:
+            hover_dict['callback'] = CustomJS(
+                args={'source': d_source, 'hovered': self.model.hovered},
+                code=load_hover_js())
         graph.add_tools(HoverTool(
             names=["{0}_data".format(ind)],
-            tooltips=tooltip.render(p=ind))
+            tooltips=tooltip.render(p=ind), **hover_dict)
         )
 
         # Plot the data
@@ -194,7 +208,7 @@ class SeparationDash():
             "{0}_x".format(ind), "{0}_y".format(ind),
             source=d_source, size=10,
             line_color=mapper, color=mapper,
-            name="{0}_data".format(ind)
+            name="{0}_data".format(ind), **rend_dict
         )
 
         # Plot guide line
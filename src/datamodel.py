@@ -1,13 +1,22 @@
+import time
+
 import numpy as np
 
-from bokeh.models import ColumnDataSource
+from bokeh.models import ColumnDataSource, IndexFilter
 from bokeh.models.callbacks import CustomJS
 
-from src.datastore import DATASET, INITIAL, PROBES, SETTINGS
-from src.helpers import load_isotherm as load_isotherm
-from src.statistics import select_data, get_isohash, find_nearest
+import src.datastore
+from src.datastore import select_pair, seed_states
+from src.downsample import downsample_isotherm
+from src.helpers import load_isotherm, load_isotherms
+from src.helpers import payload_size, load_slider_js
+from src.incremental import IncrementalKPI
+from src.jobs import JobScheduler
+from src.lod import decimate
+from src.matrix import KPIMatrix
+from src.sources import align_rows, update_source
+from src.statistics import get_isohash, find_nearest
 from functools import partial
-from threading import Thread
 from tornado import gen
 
 
@@ -24,39 +33,80 @@ class DataModel():
 
         # Save reference
         self.doc = doc
-
-        # Dataset
-        self._df = DATASET                          # Entire dataset
-        self._dfs = INITIAL                         # Pre-processed KPI dataset
-        self.ads_list = PROBES                      # All probes in the dashboard
+        self._events = []                           # Events sent, to profile
+        if src.datastore.PROFILE:
+            doc.on_change(self.record_event)
+
+        # Dataset, read when the session starts as it is loaded in the
+        # background after the server starts
+        self._df = src.datastore.CUBE               # Entire dataset, indexed
+        self._dfs = src.datastore.INITIAL           # Pre-processed KPI dataset
+        self._kpi = None                            # KPI dataset as arrays
+        if self._dfs is not None:
+            self._kpi = KPIMatrix(self._dfs)
+        self._kpi_states = {}                       # Per ads KPI to update
+        self.jobs = JobScheduler(max_jobs=2)        # Background work
+        self.ads_list = src.datastore.PROBES        # All probes in the dashboard
         self.p_range = np.arange(0.5, 20.5, 0.5)
 
         # Adsorbate definitions
-        self.g1 = SETTINGS['g1']
-        self.g2 = SETTINGS['g2']
+        self.g1 = src.datastore.SETTINGS['g1']
+        self.g2 = src.datastore.SETTINGS['g2']
 
         # Temperature definitions
-        self.t_abs = SETTINGS['t_abs']
-        self.t_tol = SETTINGS['t_tol']
+        self.t_abs = src.datastore.SETTINGS['t_abs']
+        self.t_tol = src.datastore.SETTINGS['t_tol']
 
         # Isotherm type definitions
         self.iso_type = None
 
+        # KPI states of the initial adsorbates, at the initial window
+        if self._df is not None:
+            self._kpi_states = {
+                ads: IncrementalKPI(self._df, ads, self.iso_type)
+                for ads in (self.g1, self.g2)}
+            seed_states(self.iso_type, self.t_abs, self.t_tol,
+                        self._kpi_states)
+
         # Pressure definitions
         self.lp = '1'    # 0.5 bar
         self.p1 = '1'    # 0.5 bar
         self.p2 = '10'   # 5.0 bar
 
+        # Sliders recomputed in the browser from a per-pressure matrix
+        self.client_sliders = src.datastore.CLIENT_SLIDERS
+
         # Bokeh-specific data source generation
         self.data = ColumnDataSource(
-            data=self.gen_data(self.lp, self.p1, self.p2))
+            data=self.gen_data(self.lp, self.p1, self.p2), name='kpi-data')
         self.errors = ColumnDataSource(data=self.gen_error())
+        self.matrix = ColumnDataSource(data=self.gen_matrix())
         self.g1_iso_sel = ColumnDataSource(data=self.gen_iso_dict())
         self.g2_iso_sel = ColumnDataSource(data=self.gen_iso_dict())
 
+        # Materials hovered, or scrolled into view in the material table,
+        # in the browser, to prefetch their isotherms
+        self.hovered = None
+        if src.datastore.PREFETCHER is not None:
+            self.hovered = ColumnDataSource(
+                data={'labels': []}, name='prefetch')
+            self.hovered.on_change('data', self.hover_callback)
+
+        # Points drawn in each KPI plot, if their level of detail is limited
+        self.lod_points = src.datastore.LOD_POINTS
+        self.lod_filters = {}
+        self._lod_pending = {}
+        if self.lod_points:
+            self.lod_filters = {
+                ind: IndexFilter(indices=self.lod_indices(ind))
+                for ind in ('K', 'L', 'W')
+            }
+
         # Data selection callback
         self.data.selected.on_change('indices', self.selection_callback)
-        self.data.js_on_change('data', CustomJS(code="toggleLoading()"))
+        # Tagged with the generation once new data are sent, only the
+        # latest of several quick Generate clicks gets there
+        self.data.js_on_change('tags', CustomJS(code="hideLoading()"))
 
     def callback_link_sep(self, sep_dash):
         """Link the separation dashboard to the model."""
@@ -105,6 +155,31 @@ class DataModel():
         # Working capacity slider
         self.sep_dash.wc_slider.on_change('value_throttled', self.wc_callback)
 
+        # Show a chosen isotherm at full resolution
+        self.g1_iso_sel.selected.on_change(
+            'indices', partial(self.iso_select_callback, self.g1_iso_sel))
+        self.g2_iso_sel.selected.on_change(
+            'indices', partial(self.iso_select_callback, self.g2_iso_sel))
+
+        # Refine the drawn points once a KPI plot is zoomed or panned
+        if self.lod_points:
+            for ind, plot in (('K', self.sep_dash.p_henry),
+                              ('L', self.sep_dash.p_loading),
+                              ('W', self.sep_dash.p_wc)):
+                for axis in (plot.x_range, plot.y_range):
+                    axis.on_change('start', partial(self.lod_callback, ind))
+                    axis.on_change('end', partial(self.lod_callback, ind))
+
+        # Sliders dragged at frame rate in the browser
+        if self.client_sliders:
+            for slider, kpi in ((self.sep_dash.p_slider, 'L'),
+                                (self.sep_dash.wc_slider, 'W')):
+                slider.js_on_change('value', CustomJS(
+                    args={'source': self.data, 'errors': self.errors,
+                          'matrix': self.matrix, 'kpi': kpi,
+                          'stride': len(self.p_range) + 1},
+                    code=load_slider_js()))
+
         # Slider limits
         if len(self.data.data['labels']) > 0:
             limit = find_nearest(self.p_range, np.nanmin([
@@ -114,14 +189,24 @@ class DataModel():
             self.sep_dash.p_slider.end = limit
             self.sep_dash.wc_slider.end = limit
 
+    def close(self, session_context=None):
+        """Stop background work when the session ends."""
+        self.jobs.shutdown()
+        if src.datastore.PREFETCHER is not None:
+            src.datastore.PREFETCHER.cancel(self)
+
     # #########################################################################
     # Selection update
 
     def update_data(self):
         """What to do when new data is needed."""
 
-        # Request calculation in separate thread
-        Thread(target=self.calculate_data).start()
+        # Request calculation in the background, superseding any pending
+        # one, and stop streaming isotherms of the previous selection
+        self.jobs.cancel('g1', 'g2')
+        self.jobs.submit(
+            'generate', self.calculate_data,
+            self.iso_type, self.t_abs, self.t_tol, self.g1, self.g2)
 
         # Reset any selected materials
         if self.data.selected.indices:
@@ -131,23 +216,49 @@ class DataModel():
         self.sep_dash.top_graph_labels()
 
         # Update detail plots
-        self.g1_iso_sel.data = self.gen_iso_dict()
-        self.g2_iso_sel.data = self.gen_iso_dict()
+        self.update(self.g1_iso_sel, self.gen_iso_dict())
+        self.update(self.g2_iso_sel, self.gen_iso_dict())
         self.sep_dash.p_g1iso.title.text = 'Isotherms {0}'.format(self.g1)
         self.sep_dash.p_g2iso.title.text = 'Isotherms {0}'.format(self.g2)
 
-    def calculate_data(self):
-        self._dfs = select_data(
-            self._df, self.iso_type,
-            self.t_abs, self.t_tol,
-            self.g1, self.g2
-        )
-        self.doc.add_next_tick_callback(self.push_data)
+    def calculate_data(self, job, iso_type, t_abs, t_tol, g1, g2):
+        # Keep the KPI state of the selected adsorbates, so that moving
+        # the temperature window only recomputes the affected materials
+        states = {ads: self._kpi_states.get(ads) for ads in (g1, g2)}
+        for ads, state in states.items():
+            if state is None or state.i_type != iso_type:
+                states[ads] = IncrementalKPI(self._df, ads, iso_type)
+        self._kpi_states = states
+
+        dfs = select_pair(iso_type, t_abs, t_tol, g1, g2, states=states)
+        kpi = KPIMatrix(dfs) if dfs is not None else None
+        if job.cancelled:
+            return
+        self.doc.add_next_tick_callback(
+            partial(self.push_data, job=job, dfs=dfs, kpi=kpi))
 
     @gen.coroutine
-    def push_data(self):
+    def push_data(self, job, dfs, kpi):
         """Assign data"""
-        self.data.data = self.gen_data(self.lp, self.p1, self.p2)
+        # A later Generate superseded this one
+        if not self.jobs.is_current(job):
+            return
+        # Keep the rows of materials already shown in place, so that the
+        # source can be patched rather than replaced
+        if kpi is not None:
+            order = align_rows(self.data.data['labels'], kpi.labels)
+            if order is not None:
+                kpi = kpi.take(order)
+
+        self._dfs = dfs
+        self._kpi = kpi
+        self.matrix.data = self.gen_matrix()
+
+        # The browser hides its loading overlay once the source is tagged,
+        # however the data were sent
+        self.update(self.data, self.gen_data(self.lp, self.p1, self.p2))
+        self.data.tags = [job.generation]
+        self.lod_update('K', 'L', 'W', viewport=False)
 
         # Recalculate slider limits
         if len(self.data.data['labels']) > 0:
@@ -158,27 +269,101 @@ class DataModel():
             self.sep_dash.p_slider.end = limit
             self.sep_dash.wc_slider.end = limit
 
+    def update(self, source, data):
+        """Send new source data, as a patch if only a few values changed."""
+        if self.client_sliders:
+            # The browser changes sources itself, they cannot be compared
+            source.data = data
+            return 'replace'
+        return update_source(source, data)
+
     # #########################################################################
     # Set up pressure slider and callback
 
     def uptake_callback(self, attr, old, new):
         """Callback on each pressure selected for uptake."""
+        start = time.perf_counter()
         self.lp = str(int(2*new))
+        if self.client_sliders:
+            # The browser recomputed the points, only redraw the right ones
+            self.lod_update('L')
+            return
         # regenerate graph data
         self.data.patch(self.patch_data_l(self.lp))
         if self.data.selected.indices:
             self.errors.patch(self.patch_error_l(self.data.selected.indices))
+        self.lod_update('L')
+        self.profile('uptake', start)
 
     # #########################################################################
     # Set up working capacity slider and callback
 
     def wc_callback(self, attr, old, new):
         """Callback on pressure range for working capacity."""
+        start = time.perf_counter()
         self.p1, self.p2 = str(int(2*new[0])), str(int(2*new[1]))
+        if self.client_sliders:
+            self.lod_update('W')
+            return
         # regenerate graph data
         self.data.patch(self.patch_data_w(self.p1, self.p2))
         if self.data.selected.indices:
             self.errors.patch(self.patch_error_wc(self.data.selected.indices))
+        self.lod_update('W')
+        self.profile('working capacity', start)
+
+    def record_event(self, event):
+        """Keep a document change, to measure what a callback sends."""
+        self._events.append((time.perf_counter(), event))
+
+    def profile(self, name, start):
+        """Report the latency and payload of a callback if profiling."""
+        if not src.datastore.PROFILE:
+            return
+        elapsed = time.perf_counter() - start
+        sent = [event for when, event in self._events if when >= start]
+        self._events.clear()
+        print('{0} callback: {1:.1f} ms, {2:.1f} kB sent.'.format(
+            name, elapsed * 1e3, payload_size(sent) / 2**10))
+
+    # #########################################################################
+    # Level of detail of the KPI plots
+
+    def lod_indices(self, ind, viewport=False):
+        """Points of a KPI plot to draw, in its viewport if requested."""
+        data = self.source_data()
+        x_range = y_range = None
+        if viewport:
+            plot = {'K': self.sep_dash.p_henry,
+                    'L': self.sep_dash.p_loading,
+                    'W': self.sep_dash.p_wc}[ind]
+            x_range = (plot.x_range.start, plot.x_range.end)
+            y_range = (plot.y_range.start, plot.y_range.end)
+
+        return decimate(
+            data[f'{ind}_x'], data[f'{ind}_y'], self.lod_points,
+            x_range=x_range, y_range=y_range,
+            weight=data[f'{ind}_n'],
+            keep=self.data.selected.indices).tolist()
+
+    def lod_update(self, *inds, viewport=True):
+        """Redraw some KPI plots at their level of detail."""
+        for ind in inds:
+            if ind in self.lod_filters:
+                self.lod_filters[ind].indices = self.lod_indices(
+                    ind, viewport)
+
+    def lod_callback(self, ind, attr, old, new):
+        """Refine a KPI plot once its ranges stop changing."""
+        pending = self._lod_pending.pop(ind, None)
+        if pending is not None:
+            self.doc.remove_timeout_callback(pending)
+        self._lod_pending[ind] = self.doc.add_timeout_callback(
+            partial(self.lod_refine, ind), 200)
+
+    def lod_refine(self, ind):
+        self._lod_pending.pop(ind, None)
+        self.lod_update(ind)
 
     # #########################################################################
     # Data generator
@@ -186,7 +371,7 @@ class DataModel():
     def gen_data(self, lp, p1, p2):
         """Select or generate all KPI data for a pair of ads_list."""
 
-        if self._dfs is None:
+        if self._kpi is None:
             return {
                 'labels': [], 'sel': [], 'psa_W': [],
                 'K_x': [], 'K_y': [], 'K_nx': [], 'K_ny': [], 'K_n': [],
@@ -194,136 +379,61 @@ class DataModel():
                 'W_x': [], 'W_y': [], 'W_nx': [], 'W_ny': [], 'W_n': [],
             }
 
-        # Henry coefficient
-        K_x = self._dfs[('kH_x', 'med')]
-        K_y = self._dfs[('kH_y', 'med')]
-        K_nx = self._dfs[('kH_x', 'size')]
-        K_ny = self._dfs[('kH_y', 'size')]
-        K_n = K_nx + K_ny
-
-        # Loading
-        L_x, L_y, L_nx, L_ny, L_n = 0, 0, 0, 0, 0
-        if self.lp != '0':
-
-            L_x = self._dfs[(f'{lp}_x', 'med')]
-            L_y = self._dfs[(f'{lp}_y', 'med')]
-            L_nx = self._dfs[(f'{lp}_x', 'size')]
-            L_ny = self._dfs[(f'{lp}_y', 'size')]
-            L_n = L_nx + L_ny
-
-        # Working capacity
-        if self.p1 == '0':
-            W_xp1 = W_yp1 = 0
-        else:
-            W_xp1 = self._dfs[(f'{p1}_x', 'med')]
-            W_yp1 = self._dfs[(f'{p1}_y', 'med')]
-
-        if self.p2 == '0':
-            W_xp2 = W_yp2 = 0
-        else:
-            W_xp2 = self._dfs[(f'{p2}_x', 'med')]
-            W_yp2 = self._dfs[(f'{p2}_y', 'med')]
-
-        W_x = W_xp2 - W_xp1
-        W_y = W_yp2 - W_yp1
-
-        W_nx = np.maximum(
-            self._dfs[(f'{p1}_x', 'size')] if p1 != '0' else 0,
-            self._dfs[(f'{p2}_x', 'size')] if p2 != '0' else 0
-        )
-        W_ny = np.maximum(
-            self._dfs[(f'{p1}_y', 'size')] if p1 != '0' else 0,
-            self._dfs[(f'{p2}_y', 'size')] if p2 != '0' else 0
-        )
-        W_n = W_nx + W_ny
-
-        sel = np.exp(K_y - K_x)
-        psa_W = (W_y / W_x) * sel
-
-        return {
-            'labels': self._dfs.index,
-
-            # parameters
-            'sel': sel,
-            'psa_W': psa_W,
-
-            # Henry data
-            'K_x': K_x, 'K_y': K_y,
-            'K_nx': K_nx, 'K_ny': K_ny, 'K_n': K_n,
-
-            # Loading data
-            'L_x': L_x, 'L_y': L_y,
-            'L_nx': L_nx, 'L_ny': L_ny, 'L_n': L_n,
-
-            # Working capacity data
-            'W_x': W_x, 'W_y': W_y,
-            'W_nx': W_nx, 'W_ny': W_ny, 'W_n': W_n,
-        }
+        return self._kpi.metrics(lp, p1, p2)
 
     def patch_data_l(self, p):
         """Patch KPI data when uptake changes."""
 
-        if self._dfs is None:
+        if self._kpi is None:
             return {}
 
-        if p == '0':
-            L_x = L_y = L_nx = L_ny = L_n = [0 for a in self._dfs.index]
-        else:
-            L_x = self._dfs.loc[:, (f'{p}_x', 'med')]
-            L_y = self._dfs.loc[:, (f'{p}_y', 'med')]
-            L_nx = self._dfs.loc[:, (f'{p}_x', 'size')]
-            L_ny = self._dfs.loc[:, (f'{p}_y', 'size')]
-            L_n = L_nx + L_ny
-
         return {
             # Loading data
-            'L_x': [(slice(None), L_x)], 'L_y': [(slice(None), L_y)],
-            'L_nx': [(slice(None), L_nx)], 'L_ny': [(slice(None), L_ny)],
-            'L_n': [(slice(None), L_n)]
+            key: [(slice(None), value)]
+            for key, value in self._kpi.loading(p).items()
         }
 
     def patch_data_w(self, p1, p2):
         """Patch KPI data when working capacity changes."""
 
-        if self._dfs is None:
+        if self._kpi is None:
             return {}
 
-        if self.p1 == '0':
-            W_xp1 = W_yp1 = 0
-        else:
-            W_xp1 = self._dfs[(f'{p1}_x', 'med')]
-            W_yp1 = self._dfs[(f'{p1}_y', 'med')]
-
-        if self.p2 == '0':
-            W_xp2 = W_yp2 = 0
-        else:
-            W_xp2 = self._dfs[(f'{self.p2}_x', 'med')]
-            W_yp2 = self._dfs[(f'{self.p2}_y', 'med')]
-
-        W_x = W_xp2 - W_xp1
-        W_y = W_yp2 - W_yp1
-
-        W_nx = np.maximum(
-            self._dfs[(f'{p1}_x', 'size')] if p1 != '0' else 0,
-            self._dfs[(f'{p2}_x', 'size')] if p2 != '0' else 0
-        )
-        W_ny = np.maximum(
-            self._dfs[(f'{p1}_y', 'size')] if p1 != '0' else 0,
-            self._dfs[(f'{p2}_y', 'size')] if p2 != '0' else 0
-        )
-        W_n = W_nx + W_ny
-        psa_W = (W_y / W_x) * self.data.data['sel']
-
         return {
-            # parameters
-            'psa_W': [(slice(None), psa_W)],
-
-            # Working capacity data
-            'W_x': [(slice(None), W_x)], 'W_y': [(slice(None), W_y)],
-            'W_nx': [(slice(None), W_nx)], 'W_ny': [(slice(None), W_ny)],
-            'W_n': [(slice(None), W_n)]
+            # Working capacity data and parameters
+            key: [(slice(None), value)]
+            for key, value in self._kpi.working_capacity(p1, p2).items()
         }
 
+    def source_data(self):
+        """
+        KPI data as the browser has it.
+
+        With client sliders, the browser recomputes the uptake and working
+        capacity columns of its copy of the source, so those of the server
+        copy are stale. They are taken from the matrix at the current
+        pressures instead.
+        """
+        data = self.data.data
+        if self.client_sliders and self._kpi is not None:
+            data = {
+                **data,
+                **self._kpi.loading(self.lp),
+                **self._kpi.working_capacity(self.p1, self.p2),
+            }
+        return data
+
+    def gen_matrix(self):
+        """Per-pressure KPI shipped to the browser for its sliders."""
+
+        if self._kpi is None or not self.client_sliders:
+            return {
+                'med_x': [], 'size_x': [], 'err_x': [],
+                'med_y': [], 'size_y': [], 'err_y': [],
+            }
+
+        return self._kpi.flat()
+
     # #########################################################################
     # Error generator
 
@@ -341,88 +451,14 @@ class DataModel():
                 'W_x0': [], 'W_y0': [], 'W_x1': [], 'W_y1': [],
             }
 
-        else:
-
-            mats = []
-            K_X, K_Y, L_X, L_Y, W_X, W_Y = [], [], [], [], [], []
-            K_X1, K_Y1, K_X2, K_Y2 = [], [], [], []
-            L_X1, L_Y1, L_X2, L_Y2 = [], [], [], []
-            W_X1, W_Y1, W_X2, W_Y2 = [], [], [], []
-
-            for index in indices:
-
-                mat = self.data.data['labels'][index]
-                K_x = self.data.data['K_x'][index]
-                K_y = self.data.data['K_y'][index]
-                L_x = self.data.data['L_x'][index]
-                L_y = self.data.data['L_y'][index]
-                W_x = self.data.data['W_x'][index]
-                W_y = self.data.data['W_y'][index]
-
-                # NaN values have to be avoided
-                if np.isnan(K_x) or np.isnan(K_y):
-                    K_x, K_y = 0, 0
-                    K_ex, K_ey = 0, 0
-                else:
-                    K_ex = self._dfs.loc[mat, ('kH_x', 'err')]
-                    K_ey = self._dfs.loc[mat, ('kH_y', 'err')]
-
-                if np.isnan(L_x) or np.isnan(L_y) or self.lp == '0':
-                    L_x, L_y = 0, 0
-                    L_ex, L_ey = 0, 0
-                else:
-                    L_ex = self._dfs.loc[mat,
-                                         (f'{self.lp}_x', 'err')]
-                    L_ey = self._dfs.loc[mat,
-                                         (f'{self.lp}_y', 'err')]
-
-                if np.isnan(W_x) or np.isnan(W_y):
-                    W_x, W_y = 0, 0
-                    W_ex, W_ey = 0, 0
-                else:
-                    W_ex = self._dfs.loc[mat, (f'{self.p1}_x', 'err')] if self.p1 != 0 else 0 + \
-                        self._dfs.loc[mat, ('{}_x'.format(
-                            self.p2), 'err')] if self.p2 != 0 else 0
-                    W_ey = self._dfs.loc[mat, (f'{self.p1}_y', 'err')] if self.p1 != 0 else 0 + \
-                        self._dfs.loc[mat, ('{}_y'.format(
-                            self.p2), 'err')] if self.p2 != 0 else 0
-
-                mats.extend([mat, mat])
-                K_X.extend([K_x, K_x])
-                K_Y.extend([K_y, K_y])
-                L_X.extend([L_x, L_x])
-                L_Y.extend([L_y, L_y])
-                W_X.extend([W_x, W_x])
-                W_Y.extend([W_y, W_y])
-                # henry data
-                K_X1.extend([K_x - K_ex, K_x])
-                K_Y1.extend([K_y, K_y - K_ey])
-                K_X2.extend([K_x + K_ex, K_x])
-                K_Y2.extend([K_y, K_y + K_ey])
-                # loading data
-                L_X1.extend([L_x - L_ex, L_x])
-                L_Y1.extend([L_y, L_y - L_ey])
-                L_X2.extend([L_x + L_ex, L_x])
-                L_Y2.extend([L_y, L_y + L_ey])
-                # working capacity data
-                W_X1.extend([W_x - W_ex, W_x])
-                W_Y1.extend([W_y, W_y - W_ey])
-                W_X2.extend([W_x + W_ex, W_x])
-                W_Y2.extend([W_y, W_y + W_ey])
-
-            return {
-                # labels
-                'labels': mats,
-                'K_x': K_X, 'K_y': K_Y,
-                'L_x': L_X, 'L_y': L_Y,
-                'W_x': W_X, 'W_y': W_Y,
-                # henry data
-                'K_x0': K_X1, 'K_y0': K_Y1, 'K_x1': K_X2, 'K_y1': K_Y2,
-                # loading data
-                'L_x0': L_X1, 'L_y0': L_Y1, 'L_x1': L_X2, 'L_y1': L_Y2,
-                # working capacity data
-                'W_x0': W_X1, 'W_y0': W_Y1, 'W_x1': W_X2, 'W_y1': W_Y2,
-            }
+        # Selected rows, each drawn as two error segments
+        rows = np.asarray(indices, dtype=int)
+        return {
+            'labels': np.repeat(self._kpi.labels[rows], 2),
+            **self._kpi.henry_errors(rows),
+            **self._kpi.loading_errors(rows, self.lp),
+            **self._kpi.working_capacity_errors(rows, self.p1, self.p2),
+        }
 
     def patch_error_l(self, indices=None):
         """Patch error data when uptake changes."""
@@ -436,46 +472,19 @@ class DataModel():
                 'L_x1': [(slice(None), [])],
                 'L_y1': [(slice(None), [])],
             }
-        else:
-            L_X, L_Y = [], []
-            L_X1, L_Y1, L_X2, L_Y2 = [], [], [], []
-
-            for index in indices:
-
-                L_x = self.data.data['L_x'][index]
-                L_y = self.data.data['L_y'][index]
-                if np.isnan(L_x) or np.isnan(L_y) or self.lp == '0':
-                    L_x, L_y = 0, 0
-                    L_ex, L_ey = 0, 0
-                else:
-                    mat = self.data.data['labels'][index]
-                    L_ex = self._dfs.loc[mat,
-                                         (f'{self.lp}_x', 'err')]
-                    L_ey = self._dfs.loc[mat,
-                                         (f'{self.lp}_y', 'err')]
-
-                L_X.extend([L_x, L_x])
-                L_Y.extend([L_y, L_y])
-                L_X1.extend([L_x - L_ex, L_x])
-                L_Y1.extend([L_y, L_y - L_ey])
-                L_X2.extend([L_x + L_ex, L_x])
-                L_Y2.extend([L_y, L_y + L_ey])
 
-            return {
-                # loading data
-                'L_x': [(slice(None), L_X)],
-                'L_y': [(slice(None), L_Y)],
-                'L_x0': [(slice(None), L_X1)],
-                'L_y0': [(slice(None), L_Y1)],
-                'L_x1': [(slice(None), L_X2)],
-                'L_y1': [(slice(None), L_Y2)],
-            }
+        rows = np.asarray(indices, dtype=int)
+        return {
+            # loading data
+            key: [(slice(None), value)] for key, value in
+            self._kpi.loading_errors(rows, self.lp).items()
+        }
 
     def patch_error_wc(self, indices=None):
         """Patch error data when working capacity changes."""
         if indices is None:
             return {
-                # loading data
+                # working capacity data
                 'W_x': [(slice(None), [])],
                 'W_y': [(slice(None), [])],
                 'W_x0': [(slice(None), [])],
@@ -483,42 +492,13 @@ class DataModel():
                 'W_x1': [(slice(None), [])],
                 'W_y1': [(slice(None), [])],
             }
-        else:
-            W_X, W_Y = [], []
-            W_X1, W_Y1, W_X2, W_Y2 = [], [], [], []
-
-            for index in indices:
-
-                W_x = self.data.data['W_x'][index]
-                W_y = self.data.data['W_y'][index]
-                if np.isnan(W_x) or np.isnan(W_y):
-                    W_x, W_y = 0, 0
-                    W_ex, W_ey = 0, 0
-                else:
-                    mat = self.data.data['labels'][index]
-                    W_ex = self._dfs.loc[mat, (f'{self.p1}_x', 'err')] if self.p1 != 0 else 0 + \
-                        self._dfs.loc[mat, ('{}_x'.format(
-                            self.p2), 'err')] if self.p2 != 0 else 0
-                    W_ey = self._dfs.loc[mat, (f'{self.p1}_y', 'err')] if self.p1 != 0 else 0 + \
-                        self._dfs.loc[mat, ('{}_y'.format(
-                            self.p2), 'err')] if self.p2 != 0 else 0
-
-                W_X.extend([W_x, W_x])
-                W_Y.extend([W_y, W_y])
-                W_X1.extend([W_x - W_ex, W_x])
-                W_Y1.extend([W_y, W_y - W_ey])
-                W_X2.extend([W_x + W_ex, W_x])
-                W_Y2.extend([W_y, W_y + W_ey])
 
-            return {
-                # loading data
-                'W_x': [(slice(None), W_X)],
-                'W_y': [(slice(None), W_Y)],
-                'W_x0': [(slice(None), W_X1)],
-                'W_y0': [(slice(None), W_Y1)],
-                'W_x1': [(slice(None), W_X2)],
-                'W_y1': [(slice(None), W_Y2)],
-            }
+        rows = np.asarray(indices, dtype=int)
+        return {
+            # working capacity data
+            key: [(slice(None), value)] for key, value in
+            self._kpi.working_capacity_errors(rows, self.p1, self.p2).items()
+        }
 
     # #########################################################################
     # Iso generator
@@ -540,14 +520,20 @@ class DataModel():
     def selection_callback(self, attr, old, new):
         """Display selected points on graph and the isotherms."""
 
+        # Stop streaming isotherms of the previous selection
+        self.jobs.cancel('g1', 'g2')
+
+        # Selected points are always drawn
+        self.lod_update('K', 'L', 'W')
+
         # If the user has not selected anything
         if len(new) == 0:
             # Remove error points:
-            self.errors.data = self.gen_error()
+            self.update(self.errors, self.gen_error())
 
             # Reset bottom graphs
-            self.g1_iso_sel.data = self.gen_iso_dict()
-            self.g2_iso_sel.data = self.gen_iso_dict()
+            self.update(self.g1_iso_sel, self.gen_iso_dict())
+            self.update(self.g2_iso_sel, self.gen_iso_dict())
             self.g1_iso_sel.selected.update(indices=[])
             self.g2_iso_sel.selected.update(indices=[])
             self.sep_dash.p_g1iso.x_range.end = 0.01
@@ -560,11 +546,11 @@ class DataModel():
 
         # If the user has selected more than one point
         # Display error points:
-        self.errors.data = self.gen_error(new)
+        self.update(self.errors, self.gen_error(new))
 
         # Reset bottom graphs
-        self.g1_iso_sel.data = self.gen_iso_dict()
-        self.g2_iso_sel.data = self.gen_iso_dict()
+        self.update(self.g1_iso_sel, self.gen_iso_dict())
+        self.update(self.g2_iso_sel, self.gen_iso_dict())
         self.g1_iso_sel.selected.update(indices=[])
         self.g2_iso_sel.selected.update(indices=[])
         self.sep_dash.p_g1iso.x_range.end = 0.01
@@ -580,72 +566,119 @@ class DataModel():
                 self._df, self.iso_type, self.t_abs, self.t_tol, self.g1, self.sel_mat)
             self.g2_hashes = get_isohash(
                 self._df, self.iso_type, self.t_abs, self.t_tol, self.g2, self.sel_mat)
-            Thread(target=self.populate_isos, args=['g1']).start()
-            Thread(target=self.populate_isos, args=['g2']).start()
+            if src.datastore.PREFETCHER is not None:
+                src.datastore.PREFETCHER.record_click(
+                    list(self.g1_hashes) + list(self.g2_hashes))
+            self.jobs.submit('g1', self.populate_isos, 'g1', self.sel_mat,
+                             list(self.g1_hashes), self._dfs)
+            self.jobs.submit('g2', self.populate_isos, 'g2', self.sel_mat,
+                             list(self.g2_hashes), self._dfs)
 
     # #########################################################################
     # Isotherm interactions
 
-    def populate_isos(self, ads):
-        """Threaded code to add isotherms to bottom graphs."""
+    def hover_callback(self, attr, old, new):
+        """Prefetch the isotherms of hovered materials for both probes."""
+        if not new['labels']:
+            return
+        mats = list(new['labels'])
+        args = (self._df, self.iso_type, self.t_abs, self.t_tol)
+        gases = (self.g1, self.g2)
 
-        if ads == 'g1':
-            # "average" isotherm
-            loading = self._dfs.loc[self.sel_mat,
-                                    (slice(None), 'med')].values[1:41]
-            self.doc.add_next_tick_callback(
-                partial(
-                    self.iso_update_g1,
-                    iso={'labels': ['median'],
-                         'x': [self.p_range[~np.isnan(loading)]],
-                         'y': [loading[~np.isnan(loading)]],
-                         'temp': [self.t_abs], 'doi': ['']}, color='k'))
-
-            # rest of the isotherms
-            for iso in get_isohash(
-                    self._df, self.iso_type, self.t_abs, self.t_tol,
-                    self.g1, self.sel_mat):
-                parsed = load_isotherm(iso)
-                if parsed:
-                    self.doc.add_next_tick_callback(
-                        partial(self.iso_update_g1, iso=parsed))
+        def keys():
+            return [key for mat in mats for gas in gases
+                    for key in get_isohash(*args, gas, mat)]
+
+        src.datastore.PREFETCHER.request(self, keys)
+
+    def populate_isos(self, job, ads, mat, hashes, dfs):
+        """
+        Threaded code to add isotherms to bottom graphs.
+
+        `dfs` is the KPI table the material was selected from, since
+        `self._dfs` may be replaced while the job waits.
+        """
+        if job.cancelled:
+            return
 
+        if ads == 'g1':
+            loading = dfs.loc[mat, (slice(None), 'med')].values[1:41]
+            plot = self.sep_dash.p_g1iso
         elif ads == 'g2':
-            # "average" isotherm
-            loading = self._dfs.loc[self.sel_mat,
-                                    (slice(None), 'med')].values[42:]
-            self.doc.add_next_tick_callback(
-                partial(
-                    self.iso_update_g2,
-                    iso={'labels': ['median'],
-                         'x': [self.p_range[~np.isnan(loading)]],
-                         'y': [loading[~np.isnan(loading)]],
-                         'temp': [self.t_abs], 'doi': ['']},
-                    color='k', resize=False))
-
-            # rest of the isotherms
-            for iso in get_isohash(
-                    self._df, self.iso_type, self.t_abs, self.t_tol,
-                    self.g2, self.sel_mat):
-                parsed = load_isotherm(iso)
+            loading = dfs.loc[mat, (slice(None), 'med')].values[42:]
+            plot = self.sep_dash.p_g2iso
+
+        # Points drawn per isotherm, for the size of the plot
+        max_points = 0
+        if src.datastore.ISO_POINT_SPACING:
+            max_points = plot.plot_width // src.datastore.ISO_POINT_SPACING
+
+        # "average" isotherm, sent in black with the first batch
+        batch = self.gen_iso_dict()
+        self.add_iso(batch, {
+            'labels': ['median'],
+            'x': [self.p_range[~np.isnan(loading)]],
+            'y': [loading[~np.isnan(loading)]],
+            'temp': [self.t_abs], 'doi': ['']}, color='k')
+
+        # rest of the isotherms in batches, until another selection is made
+        size = src.datastore.ISO_BATCH
+        for start in range(0, max(len(hashes), 1), size):
+            if job.cancelled:
+                return
+            for parsed in load_isotherms(
+                    hashes[start:start + size], src.datastore.ISOTHERMS):
                 if parsed:
-                    self.doc.add_next_tick_callback(
-                        partial(self.iso_update_g2, iso=parsed))
+                    self.add_iso(
+                        batch, downsample_isotherm(parsed, max_points))
+            self.doc.add_next_tick_callback(
+                partial(self.iso_update, job, ads, batch))
+            batch = self.gen_iso_dict()
+
+    @staticmethod
+    def add_iso(batch, iso, color=None):
+        """Add an isotherm to a batch, coloured by the palette if no color."""
+        for key, values in iso.items():
+            batch[key].extend(values)
+        batch['color'].append(color)
+
+    def iso_select_callback(self, source, attr, old, new):
+        """Replace a selected, downsampled, isotherm by its full data."""
+        if len(new) != 1:
+            return
+        index = new[0]
+        label = source.data['labels'][index]
+        if label == 'median':
+            return
 
-    @gen.coroutine
-    def iso_update_g1(self, iso, color=None):
-        iso['color'] = [next(self.sep_dash.c_cyc) if color is None else color]
-        self.g1_iso_sel.stream(iso)
-        if float(iso['x'][0][-1]) > self.sep_dash.p_g1iso.x_range.end:
-            self.sep_dash.p_g1iso.x_range.end = 1.1 * float(iso['x'][0][-1])
-        if float(iso['y'][0][-1]) > self.sep_dash.p_g1iso.y_range.end:
-            self.sep_dash.p_g1iso.y_range.end = 1.1 * float(iso['y'][0][-1])
+        parsed = load_isotherm(label, src.datastore.ISOTHERMS)
+        if parsed and len(parsed['x'][0]) != len(source.data['x'][index]):
+            source.patch({
+                'x': [(index, parsed['x'][0])],
+                'y': [(index, parsed['y'][0])],
+            })
 
     @gen.coroutine
-    def iso_update_g2(self, iso, color=None, resize=True):
-        iso['color'] = [next(self.sep_dash.c_cyc) if color is None else color]
-        self.g2_iso_sel.stream(iso)
-        if float(iso['x'][0][-1]) > self.sep_dash.p_g2iso.x_range.end:
-            self.sep_dash.p_g2iso.x_range.end = 1.1 * float(iso['x'][0][-1])
-        if float(iso['y'][0][-1]) > self.sep_dash.p_g2iso.y_range.end:
-            self.sep_dash.p_g2iso.y_range.end = 1.1 * float(iso['y'][0][-1])
+    def iso_update(self, job, ads, batch):
+        """Stream a batch of isotherms and fit the axes to them once."""
+        if not self.jobs.is_current(job) or not batch['labels']:
+            return
+        if ads == 'g1':
+            source, plot = self.g1_iso_sel, self.sep_dash.p_g1iso
+        elif ads == 'g2':
+            source, plot = self.g2_iso_sel, self.sep_dash.p_g2iso
+
+        batch['color'] = [
+            next(self.sep_dash.c_cyc) if color is None else color
+            for color in batch['color']
+        ]
+        source.stream(batch)
+
+        x_max = max(
+            (float(x[-1]) for x in batch['x'] if len(x)), default=0)
+        y_max = max(
+            (float(y[-1]) for y in batch['y'] if len(y)), default=0)
+        if x_max > plot.x_range.end:
+            plot.x_range.end = 1.1 * x_max
+        if y_max > plot.y_range.end:
+            plot.y_range.end = 1.1 * y_max
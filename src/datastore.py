@@ -1,13 +1,57 @@
-from src.helpers import load_data
-from src.statistics import select_data
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Event
+
+import pandas as pd
+
+from src.cache import ResultCache
+from src.cube import KPICube
+from src.helpers import load_data, load_cube, iso_packed, iso_mapped, \
+    iso_compressed, kpi_source, kpi_results
+from src.isostore import ShelveStore, MappedStore, CompressedStore, \
+    CachedStore
+from src.persist import SelectionStore
+from src.prefetch import Prefetcher
+from src.snapshot import source_digest
+from src.statistics import join_kpi, swap_kpi
 
 ################################
 # Important global variables
 ################################
 
 DATASET = None          # Entire dataset
+CUBE = None             # Dataset grouped in (ads, type, t, mat) cells
 INITIAL = None          # An example initial dataset
 PROBES = None           # Probes in the initial dataset
+READY = Event()         # Set once the dataset is loaded, or failed to
+READY_TIMEOUT = 30      # Seconds a new session waits for the dataset
+LOAD_ERROR = None       # Exception which stopped the dataset load
+TIMINGS = {}            # Duration of each startup phase (s)
+ISOTHERMS = None        # Isotherm store shared by all sessions
+ISO_CACHE_BYTES = 64 * 2**20    # Decoded isotherms kept in memory
+PREFETCH = False        # Prefetch isotherms of hovered or scrolled materials
+PREFETCH_RATE = 100     # Isotherms prefetched per second at most
+PREFETCHER = None       # Background prefetcher of the isotherm cache
+RESULTS = ResultCache(  # Pair selections shared between sessions
+    max_bytes=256 * 2**20)
+SINGLES = ResultCache(  # Single adsorbate KPI shared between sessions
+    max_bytes=256 * 2**20)
+PERSIST = None          # Pair selections saved on disk
+PERSIST_RESULTS = True  # Save pair selections and reload them at startup
+COMPACT = False         # Categorical and float32 dataset, rounds KPIs
+ENGINE = 'numpy'        # KPI engine, 'sketch' for approximate statistics
+POOL = None             # Process pool computing new pair selections
+POOL_PROCESSES = 0      # Size of the process pool, 0 computes in threads
+POOL_TIMEOUT = 30       # Seconds to wait for the pool before using a thread
+PROFILE = False         # Print latency and payload of slider callbacks
+CLIENT_SLIDERS = False  # Recompute slider KPI in the browser
+LOD_POINTS = 0          # Points drawn per KPI plot with WebGL, 0 for all
+ISO_POINT_SPACING = 2   # Pixels per drawn isotherm point, 0 for all
+ISO_BATCH = 16          # Isotherms streamed per message
 SETTINGS = {
     'g1': 'methane',
     'g2': 'carbon dioxide',
@@ -16,17 +60,299 @@ SETTINGS = {
 }
 
 
+@contextmanager
+def phase(name):
+    """Record the duration of a startup phase in `TIMINGS`."""
+    start = time.perf_counter()
+    yield
+    TIMINGS[name] = time.perf_counter() - start
+
+
 def load():
-    """Load the global dataset and an example."""
+    """
+    Load the global dataset and an example, then set `READY`.
+
+    If loading fails the error is kept in `LOAD_ERROR` and raised, and
+    `READY` is set all the same so that sessions stop waiting.
+    """
     print('Loading and calculating initial data.')
-    global DATASET, INITIAL, PROBES, SETTINGS
-    # Global dataset
-    DATASET = load_data()
-    # List of available probes
-    PROBES = sorted(list(DATASET['ads'].unique()))
-    # Example dataset
-    INITIAL = select_data(
-        DATASET, None,
-        SETTINGS['t_abs'], SETTINGS['t_tol'],
-        SETTINGS['g1'], SETTINGS['g2'])
-    print('Data load complete.')
+    global DATASET, CUBE, INITIAL, PROBES, SETTINGS, LOAD_ERROR
+    try:
+        # Global dataset, from the binary snapshot if there is one
+        with phase('dataset'):
+            DATASET = load_data(compact=COMPACT)
+        # Precomputed cube, built in memory if not found on disk
+        with phase('cube'):
+            CUBE = load_cube(DATASET)
+            if CUBE is None:
+                CUBE = KPICube.from_frame(DATASET)
+            if ENGINE == 'sketch':
+                CUBE.build_sketches()
+        # List of available probes
+        PROBES = sorted(list(DATASET['ads'].unique()))
+        # Pair selections saved by previous runs
+        with phase('saved'):
+            open_results()
+        # Example dataset
+        with phase('initial'):
+            key = (None, SETTINGS['t_abs'], SETTINGS['t_tol'],
+                   SETTINGS['g1'], SETTINGS['g2'])
+            # Single tables too, which seed the states of new sessions
+            for ads in key[3:]:
+                select_single(*key[:3], ads)
+            INITIAL = select_pair(*key)
+    except Exception as e:
+        LOAD_ERROR = e
+        print('Data load failed.')
+        raise
+    finally:
+        READY.set()
+
+    print('Data load complete: {0}.'.format(', '.join(
+        '{0} {1:.2f} s'.format(name, seconds)
+        for name, seconds in TIMINGS.items())))
+    # Measuring the string columns takes a while, so sessions need not wait
+    report_memory()
+
+
+def report_memory():
+    """Print the memory held by the dataset and its cube."""
+    sizes = {
+        'dataset': DATASET.memory_usage(deep=True).sum(),
+        'cube': CUBE.nbytes,
+    }
+    if CUBE.sketches is not None:
+        sizes['sketches'] = CUBE.sketches.nbytes
+    print('Dataset memory: {0}, total {1:.1f} MB.'.format(', '.join(
+        '{0} {1:.1f} MB'.format(name, size / 2**20)
+        for name, size in sizes.items()), sum(sizes.values()) / 2**20))
+
+
+def wait_ready(timeout=None):
+    """Wait for the dataset, True if it loaded within `timeout` seconds."""
+    return READY.wait(timeout) and LOAD_ERROR is None
+
+
+def select_single(i_type, t_abs, t_tol, ads, state=None):
+    """
+    KPI of a single adsorbate, memoised across sessions.
+
+    An `IncrementalKPI` state for the same adsorbate and type is moved to
+    the new window: on a miss it computes the table from its previous
+    window, and on a hit it is seeded with the cached table.
+    """
+    key = (i_type, t_abs, t_tol, ads)
+    if state is not None and state.engine == ENGINE:
+        kpi = SINGLES.get_or_compute(
+            key, lambda: state.update(t_abs, t_tol))
+        state.seed(t_abs, t_tol, kpi)
+        return kpi
+    return SINGLES.get_or_compute(
+        key, lambda: CUBE.select_data_single(*key, engine=ENGINE))
+
+
+def select_pair(i_type, t_abs, t_tol, g1, g2, states=None):
+    """
+    KPI of an adsorbate pair, memoised across sessions.
+
+    Pairs are joined from the single adsorbate tables, and a pair already
+    computed in the opposite order is relabelled instead. `states` maps
+    adsorbates to their `IncrementalKPI`, if any, which are seeded with
+    cached single tables when the pair itself is cached. New pairs are
+    saved on disk if `PERSIST` is open.
+
+    When the process pool is running, pairs whose single adsorbate tables
+    are not both cached are computed there instead. Workers have their
+    own caches and no `IncrementalKPI` states, so `states` is not used
+    for those pairs. If the pool takes longer than `POOL_TIMEOUT`, the
+    pair is computed in the calling thread.
+    """
+    states = states or {}
+    key = (i_type, t_abs, t_tol, g1, g2)
+
+    def select():
+        swapped = RESULTS.peek((i_type, t_abs, t_tol, g2, g1))
+        if swapped is not None:
+            return swap_kpi(swapped)
+        cached = all(SINGLES.peek((i_type, t_abs, t_tol, ads)) is not None
+                     for ads in (g1, g2))
+        if POOL is not None and not cached:
+            future = POOL.submit(_pool_select, i_type, t_abs, t_tol, g1, g2)
+            try:
+                return unpack_kpi(future.result(timeout=POOL_TIMEOUT))
+            except TimeoutError:
+                future.cancel()
+                print('KPI process pool timed out, computing in a thread.')
+            except BrokenProcessPool:
+                print('KPI process pool failed, computing in threads.')
+                stop_pool()
+        return join_kpi(
+            select_single(i_type, t_abs, t_tol, g1, states.get(g1)),
+            select_single(i_type, t_abs, t_tol, g2, states.get(g2)))
+
+    def compute():
+        dfs = select()
+        if PERSIST is not None:
+            PERSIST.save(key, pack_kpi(dfs))
+        return dfs
+
+    dfs = RESULTS.get_or_compute(key, compute)
+    seed_states(i_type, t_abs, t_tol, states)
+    return dfs
+
+
+def seed_states(i_type, t_abs, t_tol, states):
+    """Move `IncrementalKPI` states to a window whose tables are cached."""
+    for ads, state in states.items():
+        if state is None or state.engine != ENGINE:
+            continue
+        kpi = SINGLES.peek((i_type, t_abs, t_tol, ads))
+        if kpi is not None:
+            state.seed(t_abs, t_tol, kpi)
+
+
+def open_results():
+    """
+    Open the pair selections saved for this version of the dataset, and
+    reload the most recent ones into `RESULTS`.
+    """
+    global PERSIST
+    if not PERSIST_RESULTS:
+        return
+    digest = source_digest(kpi_source)
+    if digest is None:
+        return
+    variant = '{0}-{1}'.format(ENGINE, 'compact' if COMPACT else 'full')
+    PERSIST = SelectionStore(kpi_results, digest, variant)
+    saved = PERSIST.load(RESULTS.max_bytes)
+    # Oldest first, so that the most recent are the last evicted
+    for key, packed in reversed(saved):
+        RESULTS.put(key, unpack_kpi(packed))
+    print(f'{len(saved)} saved pair selections reloaded.')
+
+
+def close_results():
+    """Mark the pair selections of this run as the most recently used."""
+    if PERSIST is not None:
+        PERSIST.flush()
+        PERSIST.touch(RESULTS.keys())
+
+
+################################
+# Isotherm store
+################################
+
+def open_isotherms():
+    """
+    Open the isotherm store once for the whole server.
+
+    The memory-mapped store is used if it has been written, then the
+    compressed store, otherwise the shelve.
+    """
+    global ISOTHERMS
+    if ISOTHERMS is None:
+        if Path(f'{iso_mapped}.npy').exists():
+            ISOTHERMS = MappedStore(iso_mapped)
+        elif Path(f'{iso_compressed}.bin').exists():
+            ISOTHERMS = CompressedStore(iso_compressed)
+        else:
+            ISOTHERMS = ShelveStore(iso_packed)
+        TIMINGS['isotherms'] = ISOTHERMS.open_time
+        print('Isotherm store opened in {0:.1f} ms.'.format(
+            ISOTHERMS.open_time * 1e3))
+        if ISO_CACHE_BYTES:
+            ISOTHERMS = CachedStore(ISOTHERMS, ISO_CACHE_BYTES)
+
+
+def start_prefetcher():
+    """Start prefetching isotherms into the isotherm cache, if enabled."""
+    global PREFETCHER
+    if PREFETCH and PREFETCHER is None and \
+            isinstance(ISOTHERMS, CachedStore):
+        PREFETCHER = Prefetcher(ISOTHERMS, rate=PREFETCH_RATE)
+
+
+def close_isotherms():
+    """Close the isotherm store."""
+    global ISOTHERMS
+    store, ISOTHERMS = ISOTHERMS, None
+    if PREFETCHER is not None:
+        print('Isotherm prefetch: {warm_share:.0%} of {clicks} clicks '
+              'warm.'.format(**PREFETCHER.stats()))
+    if store is not None:
+        stats = store.stats()
+        print('Isotherm store: {reads} reads in {read_time:.2f} s.'.format(
+            **stats))
+        if 'hit_ratio' in stats:
+            print('Isotherm cache: {hit_ratio:.0%} hits, {bytes} bytes, '
+                  'hottest {hottest}.'.format(**stats))
+        store.close()
+
+
+################################
+# Process pool
+################################
+
+def start_pool(processes=None):
+    """
+    Start computing new pair selections in a pool of processes.
+
+    This keeps the pandas work of `select_pair` from holding the GIL of
+    the server process. By default the pool has `POOL_PROCESSES` workers,
+    with 0 keeping the computation in the calling thread.
+
+    Workers are spawned rather than forked, since forking copies the
+    locks of the server threads in whatever state they are. Each worker
+    loads the dataset itself.
+    """
+    global POOL
+    processes = POOL_PROCESSES if processes is None else processes
+    if processes and POOL is None:
+        POOL = ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker,
+            mp_context=multiprocessing.get_context('spawn'))
+        print(f'KPI process pool started with {processes} workers.')
+
+
+def stop_pool():
+    """Shut down the process pool, falling back to threads."""
+    global POOL
+    pool, POOL = POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def _init_worker():
+    """Prepare a worker, which computes locally and needs the dataset."""
+    global POOL, RESULTS, SINGLES, PERSIST, PERSIST_RESULTS
+    POOL = None
+    # Selections computed by workers are saved by the parent
+    PERSIST, PERSIST_RESULTS = None, False
+    # Workers started by fork copy the caches, with pending keys
+    RESULTS = ResultCache(RESULTS.max_bytes)
+    SINGLES = ResultCache(SINGLES.max_bytes)
+    if CUBE is None:
+        load()
+
+
+def _pool_select(i_type, t_abs, t_tol, g1, g2):
+    """Compute a pair in a worker, packed as NumPy arrays."""
+    return pack_kpi(select_pair(i_type, t_abs, t_tol, g1, g2))
+
+
+def pack_kpi(dfs):
+    """Split a KPI table into arrays which are cheap to pickle."""
+    if dfs is None:
+        return None
+    return dfs.index.to_numpy(), dfs.to_numpy(dtype=float), \
+        dfs.columns.tolist()
+
+
+def unpack_kpi(packed):
+    """Rebuild a KPI table from `pack_kpi` arrays."""
+    if packed is None:
+        return None
+    index, values, columns = packed
+    return pd.DataFrame(
+        values, index=pd.Index(index, name='mat'),
+        columns=pd.MultiIndex.from_tuples(columns))
@@ -0,0 +1,49 @@
+"""
+Downsampling of isotherm curves for display.
+
+Isotherm plots are only a few hundred pixels wide, so curves with many
+points are reduced with the largest-triangle-three-buckets algorithm
+(Steinarsson, 2013), which keeps the first and last points and, in each
+bucket in between, the point forming the largest triangle with its
+neighbours. Peaks and steps of the curve are therefore preserved.
+"""
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """Indices of `n_out` points of a curve which keep its shape."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Buckets between the first and last points
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        after = bounds[i + 2] if i + 2 < len(bounds) else n
+        avg_x = x[stop:after].mean()
+        avg_y = y[stop:after].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a]) -
+            (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return keep
+
+
+def downsample_isotherm(iso, max_points):
+    """An isotherm dict, as from `load_isotherm`, with fewer points."""
+    x, y = np.asarray(iso['x'][0]), np.asarray(iso['y'][0])
+    if not max_points or len(x) <= max_points:
+        return iso
+
+    keep = lttb(x, y, max_points)
+    return dict(iso, x=[x[keep]], y=[y[keep]])
@@ -8,6 +8,11 @@ j2_env = Environment(
 # see: https://bugs.python.org/issue33617
 
 iso_packed = "./data/iso-packed"
+iso_mapped = "./data/iso-mapped"
+iso_compressed = "./data/iso-compressed"
+kpi_source = "./data/kpi.h5"
+kpi_snapshot = "./data/kpi-snapshot"
+kpi_results = "./data/kpi-results"
 
 
 def load_tooltip():
@@ -20,6 +25,11 @@ def load_details():
     return j2_env.get_template('iso-details.html')
 
 
+def load_loading_page():
+    """Load the page shown while the dataset is loading."""
+    return j2_env.get_template('loading.html')
+
+
 def load_details_js():
     """Load the detail snippet."""
     path = Path.cwd() / 'templates' / 'js' / 'populate-details.js'
@@ -27,18 +37,24 @@ def load_details_js():
         return file.read()
 
 
-def load_isotherm(filename):
-    """Load a particular isotherm."""
+def load_slider_js():
+    """Load the browser-side slider callback."""
+    path = Path.cwd() / 'templates' / 'js' / 'slider-kpi.js'
+    with open(path, 'r') as file:
+        return file.read()
 
-    import shelve
 
-    iso_packed = "./data/iso-packed"
+def load_hover_js():
+    """Load the hover callback reporting materials to prefetch."""
+    path = Path.cwd() / 'templates' / 'js' / 'hover-prefetch.js'
+    with open(path, 'r') as file:
+        return file.read()
+
 
-    try:
-        with shelve.open(iso_packed) as db:
-            iso = db[filename]
-    except Exception as e:
-        print(e)
+def iso_dict(filename, iso):
+    """Isotherm as a single row of the isotherm plot sources."""
+    if iso is None:
+        return None
 
     return {
         'labels': [filename],
@@ -49,7 +65,108 @@ def load_isotherm(filename):
     }
 
 
-def load_data():
-    """Load explorer data."""
+def load_isotherm(filename, store=None):
+    """Load a particular isotherm, from an open store if given."""
+
+    if store is not None:
+        return iso_dict(filename, store.get(filename))
+
+    import shelve
+    try:
+        with shelve.open(iso_packed, flag='r') as db:
+            return iso_dict(filename, db[filename])
+    except Exception as e:
+        print(e)
+
+
+def load_isotherms(filenames, store=None):
+    """Load several isotherms, with a single store call if given."""
+
+    if store is None:
+        return [load_isotherm(filename) for filename in filenames]
+
+    return [
+        iso_dict(filename, iso)
+        for filename, iso in zip(filenames, store.get_many(filenames))
+    ]
+
+
+def payload_size(events):
+    """
+    Size in bytes of the websocket frames Bokeh sends for document events.
+
+    The events are packed in a PATCH-DOC message, as the server does, and
+    the size of its JSON parts and binary array buffers is added up.
+    """
+    from bokeh.protocol import Protocol
+    if not events:
+        return 0
+    message = Protocol('1.0').create('PATCH-DOC', events)
+    size = sum(len(part) for part in (
+        message.header_json, message.metadata_json, message.content_json))
+    for header, payload in message.buffers:
+        size += len(header) + len(payload)
+    return size
+
+
+def load_data(compact=False, snapshot=True):
+    """
+    Load explorer data, from the binary snapshot if it is up to date.
+
+    In compact mode the string columns become categoricals and the KPI
+    columns float32. When read from HDF5, the memory used before and after
+    is reported; the snapshot already holds categoricals, and measuring
+    the string index is a large part of its read time.
+    `datastore.report_memory` reports the cube on top of it.
+    """
     import pandas as pd
-    return pd.read_hdf(Path.cwd() / 'data' / 'kpi.h5', 'table')
+    from src.snapshot import read
+    frames = None
+    if snapshot:
+        frames = read(kpi_snapshot, kpi_source, ['data'], categories=compact)
+    if frames is not None:
+        data = frames[0]
+    else:
+        data = pd.read_hdf(kpi_source, 'table')
+
+    if compact and frames is not None:
+        data = compact_data(data)
+    elif compact:
+        before = data.memory_usage(deep=True).sum()
+        data = compact_data(data)
+        after = data.memory_usage(deep=True).sum()
+        print('KPI dataset memory: {0:.1f} MB -> {1:.1f} MB.'.format(
+            before / 2**20, after / 2**20))
+
+    return data
+
+
+def compact_data(data):
+    """Use categorical string columns and float32 KPI columns."""
+    kpi = [c for c in data.columns if c not in ('mat', 'ads', 't', 'type')]
+    return data.astype({
+        'mat': 'category', 'ads': 'category', 'type': 'category',
+        **{c: 'float32' for c in kpi},
+    })
+
+
+def load_cube(data, snapshot=True):
+    """
+    Load the precomputed KPI cube of `data`, if it has been built.
+
+    A cube built from another version of `kpi.h5` is ignored.
+    """
+    from src.cube import KPICube
+    from src.snapshot import read, source_digest
+    digest = source_digest(kpi_source)
+    if snapshot:
+        frames = read(kpi_snapshot, kpi_source, ['positions', 'cells'])
+        if frames is not None and len(frames[0]) == len(data):
+            return KPICube(
+                data, frames[0]['position'].to_numpy(), frames[1], digest)
+    path = Path.cwd() / 'data' / 'kpi-cube.h5'
+    if path.exists():
+        cube = KPICube.read(path, data)
+        if cube is not None and (digest is None or cube.source == digest):
+            return cube
+        print(f'KPI cube {path} is out of date, ignored.')
@@ -0,0 +1,83 @@
+"""
+Incremental KPI updates for a moving temperature window.
+
+When only the temperature or its tolerance changes, most isotherms stay
+in the selection. The previous rows of every material are kept, and only
+materials which gained or lost isotherms are recomputed. A state can also
+be seeded with a table computed elsewhere, like a cached one.
+"""
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from src.statistics import group_kpi
+
+
+class IncrementalKPI():
+    """
+    KPI of one adsorbate and isotherm type, updated window by window.
+
+    `cube` is the `KPICube` of the dataset.
+    """
+
+    def __init__(self, cube, ads, i_type, engine='numpy'):
+
+        self.cube = cube
+        self.ads = ads
+        self.i_type = i_type
+        self.engine = engine
+
+        self.window = None          # (t_abs, t_tol) of the current window
+        self.positions = None       # Rows in the current window
+        self.kpi = None             # KPI of the current window
+
+        self.recomputed = 0         # Materials recomputed in last update
+        self.reused = 0             # Materials reused in last update
+
+        self._lock = Lock()
+
+    def update(self, t_abs, t_tol):
+        """Move the temperature window and return the new KPI table."""
+        with self._lock:
+            return self._update(t_abs, t_tol)
+
+    def seed(self, t_abs, t_tol, kpi):
+        """Move the temperature window to a KPI table already computed."""
+        with self._lock:
+            if self.window != (t_abs, t_tol):
+                self.positions = self.cube.window(
+                    self.i_type, t_abs, t_tol, self.ads)
+                self.kpi = kpi
+                self.window = (t_abs, t_tol)
+
+    def _update(self, t_abs, t_tol):
+        positions = self.cube.window(self.i_type, t_abs, t_tol, self.ads)
+        rows = self.cube.data.iloc[positions]
+        mats = rows['mat'].to_numpy()
+
+        if self.kpi is None:
+            changed = None
+        else:
+            # Materials with isotherms entering or leaving the window
+            moved = np.setxor1d(positions, self.positions, assume_unique=True)
+            changed = pd.unique(
+                self.cube.data['mat'].iloc[moved].to_numpy())
+
+        if changed is None or 2 * len(changed) > len(self.kpi):
+            # Mostly new materials, a full pass is cheaper
+            kpi = group_kpi(rows, self.engine)
+            self.recomputed, self.reused = len(kpi), 0
+        elif len(changed) == 0:
+            kpi = self.kpi
+            self.recomputed, self.reused = 0, len(kpi)
+        else:
+            kept = self.kpi.drop(changed, errors='ignore')
+            fresh = group_kpi(rows[np.isin(mats, changed)], self.engine)
+            kpi = pd.concat([kept, fresh], sort=False).loc[pd.unique(mats)]
+            self.recomputed, self.reused = len(fresh), len(kept)
+
+        self.window = (t_abs, t_tol)
+        self.positions = positions
+        self.kpi = kpi
+        return kpi
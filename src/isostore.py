@@ -0,0 +1,482 @@
+"""
+Access to the packed isotherm data.
+
+Stores are opened once, read-only, when the server loads and shared by
+every session. Two formats are available:
+
+* `ShelveStore` reads the original shelve of pickled isotherm dicts. dbm
+  files are not safe to read from several threads at once, so reads are
+  serialised by a lock.
+* `MappedStore` reads a single memory-mapped float array holding the
+  pressures then loadings of every isotherm, with an index of where each
+  isotherm starts. Isotherms are returned as views of the mapped file,
+  without unpickling or copying, and reads need no lock.
+* `CompressedStore` reads isotherms quantised in steps of 2**-24 of the
+  largest value of each curve, delta encoded and compressed with zlib one
+  by one, from a single memory-mapped file. It is several times smaller
+  on disk. The error is absolute, so small values of a curve, like the
+  first points of an isotherm, keep fewer significant digits.
+
+Either can be put behind a `CachedStore`, which keeps the isotherms of
+popular materials decoded in memory.
+
+Running this module converts the shelve to the other formats, or
+compares their size and read time with `python -m src.isostore benchmark`.
+"""
+import argparse
+import mmap
+import os
+import shelve
+import sys
+import time
+import zlib
+from collections import Counter
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from src.cache import ResultCache, nbytes
+
+_MISSING = object()
+
+
+class ShelveStore():
+    """
+    A read-only isotherm shelve, kept open.
+
+    Isotherms are dicts of `x`, `y`, `doi` and `temp`, keyed by their
+    hash. Missing isotherms are returned as None.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = Lock()
+
+        start = time.perf_counter()
+        self._db = shelve.open(path, flag='r')
+        self.open_time = time.perf_counter() - start
+
+        self.reads = 0                  # Isotherms read
+        self.misses = 0                 # Isotherms not found
+        self.read_time = 0.0            # Time spent reading (s)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._db)
+
+    def keys(self):
+        """Keys of all isotherms."""
+        with self._lock:
+            return list(self._db.keys())
+
+    def get(self, key):
+        """Read one isotherm."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Read several isotherms, holding the lock once."""
+        result = []
+        with self._lock:
+            start = time.perf_counter()
+            for key in keys:
+                try:
+                    result.append(self._db[key])
+                except KeyError:
+                    result.append(None)
+                    self.misses += 1
+            self.reads += len(result)
+            self.read_time += time.perf_counter() - start
+        return result
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self):
+        """Store counters."""
+        with self._lock:
+            return {
+                'open_time': self.open_time,
+                'reads': self.reads,
+                'misses': self.misses,
+                'read_time': self.read_time,
+            }
+
+
+class MappedStore():
+    """
+    A read-only memory-mapped isotherm store.
+
+    `path` is the common name of the `.npy` array of values and of the
+    `.h5` index of (offset, length, temp, doi, adsorbate, material) per
+    isotherm. `x` and `y` of returned isotherms are read-only views.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = Lock()
+
+        start = time.perf_counter()
+        # Plain array view of the mapping, faster to slice than a memmap
+        self.values = np.load(f'{path}.npy', mmap_mode='r').view(np.ndarray)
+        index = pd.read_hdf(f'{path}.h5', 'index')
+        self._rows = {key: i for i, key in enumerate(index.index)}
+        self._offset = index['offset'].to_numpy()
+        self._length = index['length'].to_numpy()
+        self._meta = index[['temp', 'doi', 'adsorbate', 'material']].to_dict(
+            'records')
+        self.open_time = time.perf_counter() - start
+
+        self.reads = 0                  # Isotherms read
+        self.misses = 0                 # Isotherms not found
+        self.read_time = 0.0            # Time spent reading (s)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, key):
+        """Read one isotherm."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Read several isotherms."""
+        start = time.perf_counter()
+        result, misses = [], 0
+        for key in keys:
+            row = self._rows.get(key)
+            if row is None:
+                result.append(None)
+                misses += 1
+                continue
+            offset, length = self._offset[row], self._length[row]
+            result.append(dict(
+                self._meta[row],
+                x=self.values[offset:offset + length],
+                y=self.values[offset + length:offset + 2 * length],
+            ))
+
+        with self._lock:
+            self.reads += len(result)
+            self.misses += misses
+            self.read_time += time.perf_counter() - start
+        return result
+
+    def close(self):
+        self.values = None
+
+    def stats(self):
+        """Store counters."""
+        with self._lock:
+            return {
+                'open_time': self.open_time,
+                'reads': self.reads,
+                'misses': self.misses,
+                'read_time': self.read_time,
+            }
+
+    @staticmethod
+    def write(isotherms, path):
+        """
+        Write (key, isotherm) pairs in the mapped format.
+
+        Isotherms are dicts like those of the shelve, with `x`, `y`,
+        `temp`, `doi`, `adsorbate` and `material`.
+        """
+        keys, values, index = [], [], []
+        offset = 0
+        for key, iso in isotherms:
+            x = np.asarray(iso['x'], dtype=float)
+            y = np.asarray(iso['y'], dtype=float)
+            keys.append(key)
+            values.extend((x, y))
+            index.append({
+                'offset': offset, 'length': len(x),
+                'temp': iso['temp'], 'doi': iso['doi'],
+                'adsorbate': iso['adsorbate'], 'material': iso['material'],
+            })
+            offset += 2 * len(x)
+
+        values = np.concatenate(values) if values else np.zeros(0)
+        np.save(f'{path}.npy', values)
+        pd.DataFrame(index, index=keys).to_hdf(
+            f'{path}.h5', key='index', mode='w')
+
+
+QUANTUM = 2.0 ** -24             # Quantisation step, relative to the max
+
+
+def encode_isotherm(x, y):
+    """
+    Compress the pressures and loadings of an isotherm.
+
+    Values are quantised to `QUANTUM` of their largest magnitude, so each
+    value is within half a step of the original, whatever its own size.
+    The differences of consecutive values, which are small for smooth
+    curves, are stored byte-shuffled and compressed with zlib. Returns the
+    bytes and the quantisation steps of x and y.
+    """
+    steps, deltas = [], []
+    for values in (x, y):
+        values = np.asarray(values, dtype=float)
+        top = np.abs(values).max() if len(values) else 0
+        step = top * QUANTUM if top > 0 else 1.0
+        quantised = np.rint(values / step).astype(np.int64)
+        steps.append(step)
+        deltas.append(np.diff(quantised, prepend=0).astype(np.int32))
+
+    shuffled = np.concatenate(deltas).view(np.uint8).reshape(-1, 4).T
+    return zlib.compress(shuffled.tobytes(), 6), steps[0], steps[1]
+
+
+def decode_isotherm(data, length, x_step, y_step):
+    """Decompress an isotherm of `length` points written by `encode`."""
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    deltas = shuffled.reshape(4, -1).T.copy().view(np.int32).ravel()
+    quantised = np.cumsum(deltas.reshape(2, length), axis=1)
+    return quantised[0] * x_step, quantised[1] * y_step
+
+
+class CompressedStore():
+    """
+    A read-only store of individually compressed isotherms.
+
+    `path` is the common name of the `.bin` file of compressed isotherms
+    and of the `.h5` index of (offset, size, length, x_step, y_step,
+    temp, doi, adsorbate, material) per isotherm.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = Lock()
+
+        start = time.perf_counter()
+        with open(f'{path}.bin', 'rb') as file:
+            self._data = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.path.getsize(f'{path}.bin') else b''
+        index = pd.read_hdf(f'{path}.h5', 'index')
+        self._rows = {key: i for i, key in enumerate(index.index)}
+        self._codec = list(zip(
+            index['offset'].to_numpy(), index['size'].to_numpy(),
+            index['length'].to_numpy(),
+            index['x_step'].to_numpy(), index['y_step'].to_numpy()))
+        self._meta = index[['temp', 'doi', 'adsorbate', 'material']].to_dict(
+            'records')
+        self.open_time = time.perf_counter() - start
+
+        self.reads = 0                  # Isotherms read
+        self.misses = 0                 # Isotherms not found
+        self.read_time = 0.0            # Time spent reading (s)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, key):
+        """Read one isotherm."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Read several isotherms."""
+        start = time.perf_counter()
+        result, misses = [], 0
+        for key in keys:
+            row = self._rows.get(key)
+            if row is None:
+                result.append(None)
+                misses += 1
+                continue
+            offset, size, length, x_step, y_step = self._codec[row]
+            x, y = decode_isotherm(
+                self._data[offset:offset + size], length, x_step, y_step)
+            result.append(dict(self._meta[row], x=x, y=y))
+
+        with self._lock:
+            self.reads += len(result)
+            self.misses += misses
+            self.read_time += time.perf_counter() - start
+        return result
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def stats(self):
+        """Store counters."""
+        with self._lock:
+            return {
+                'open_time': self.open_time,
+                'reads': self.reads,
+                'misses': self.misses,
+                'read_time': self.read_time,
+            }
+
+    @staticmethod
+    def write(isotherms, path):
+        """
+        Write (key, isotherm) pairs in the compressed format.
+
+        Isotherms are dicts like those of the shelve, with `x`, `y`,
+        `temp`, `doi`, `adsorbate` and `material`.
+        """
+        keys, index = [], []
+        offset = 0
+        with open(f'{path}.bin', 'wb') as file:
+            for key, iso in isotherms:
+                data, x_step, y_step = encode_isotherm(iso['x'], iso['y'])
+                file.write(data)
+                keys.append(key)
+                index.append({
+                    'offset': offset, 'size': len(data),
+                    'length': len(iso['x']),
+                    'x_step': x_step, 'y_step': y_step,
+                    'temp': iso['temp'], 'doi': iso['doi'],
+                    'adsorbate': iso['adsorbate'],
+                    'material': iso['material'],
+                })
+                offset += len(data)
+
+        pd.DataFrame(index, index=keys).to_hdf(
+            f'{path}.h5', key='index', mode='w', complevel=9, complib='zlib')
+
+
+def iso_nbytes(iso):
+    """Approximate in-memory size of a decoded isotherm."""
+    size = sys.getsizeof(iso)
+    for value in iso.values():
+        size += nbytes(value)
+        if isinstance(value, list):
+            size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class CachedStore():
+    """
+    A byte-bounded LRU cache of decoded isotherms in front of a store.
+
+    Requests are also counted per isotherm, to find the hottest ones when
+    sizing the cache. Isotherms read by `warm` are in neither count.
+    """
+
+    def __init__(self, store, max_bytes):
+
+        self.store = store
+        self.cache = ResultCache(max_bytes, sizeof=iso_nbytes)
+        self._requests = Counter()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Read one isotherm."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Read several isotherms, with one store call for the misses."""
+        result = [self.cache.get(key, _MISSING) for key in keys]
+        missing = [key for key, iso in zip(keys, result) if iso is _MISSING]
+
+        if missing:
+            loaded = self._load(missing)
+            result = [
+                loaded[key] if iso is _MISSING else iso
+                for key, iso in zip(keys, result)
+            ]
+
+        with self._lock:
+            self._requests.update(keys)
+        return result
+
+    def warm(self, keys):
+        """
+        Read isotherms into the cache ahead of their request.
+
+        Unlike `get_many`, this counts neither as cache lookups nor as
+        requests. Returns the keys that were read from the store.
+        """
+        missing = [key for key in keys if key not in self.cache]
+        if not missing:
+            return []
+        loaded = self._load(missing)
+        return [key for key, iso in loaded.items() if iso is not None]
+
+    def _load(self, keys):
+        """Read isotherms from the store and cache them."""
+        loaded = dict(zip(keys, self.store.get_many(keys)))
+        for key, iso in loaded.items():
+            if iso is not None:
+                self.cache.put(key, iso)
+        return loaded
+
+    def hottest(self, n=10):
+        """The `n` most requested isotherms and their request counts."""
+        with self._lock:
+            return self._requests.most_common(n)
+
+    def close(self):
+        self.store.close()
+
+    def stats(self):
+        """Store and cache counters."""
+        cache = self.cache.stats()
+        lookups = cache['hits'] + cache['misses']
+        return dict(
+            self.store.stats(),
+            hit_ratio=cache['hits'] / lookups if lookups else 0,
+            entries=cache['entries'],
+            bytes=cache['bytes'],
+            max_bytes=cache['max_bytes'],
+            evictions=cache['evictions'],
+            hottest=self.hottest(),
+        )
+
+
+def _file_size(*paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def benchmark(stores, sizes, keys):
+    """Print the bytes per isotherm and read time of some stores."""
+    for name, store in stores.items():
+        start = time.perf_counter()
+        for key in keys:
+            store.get(key)
+        elapsed = time.perf_counter() - start
+        print('{0:>10}: {1:8.0f} bytes/isotherm, {2:6.1f} us/isotherm'.format(
+            name, sizes[name] / max(len(store), 1),
+            elapsed / max(len(keys), 1) * 1e6))
+
+
+if __name__ == '__main__':
+    from src.helpers import iso_packed, iso_mapped, iso_compressed
+
+    parser = argparse.ArgumentParser(
+        description='Convert the isotherm shelve or compare the formats.')
+    parser.add_argument(
+        'action', nargs='?', default='convert',
+        choices=['convert', 'benchmark'])
+    args = parser.parse_args()
+
+    if args.action == 'convert':
+        with shelve.open(iso_packed, flag='r') as db:
+            MappedStore.write(db.items(), iso_mapped)
+            print(f'Isotherms written to {iso_mapped}.npy and .h5.')
+            CompressedStore.write(db.items(), iso_compressed)
+            print(f'Isotherms written to {iso_compressed}.bin and .h5.')
+    else:
+        shelf = ShelveStore(iso_packed)
+        stores = {
+            'shelve': shelf,
+            'mapped': MappedStore(iso_mapped),
+            'compressed': CompressedStore(iso_compressed),
+        }
+        sizes = {
+            'shelve': _file_size(*(
+                iso_packed + ext
+                for ext in ('', '.db', '.bak', '.dat', '.dir'))),
+            'mapped': _file_size(iso_mapped + '.npy', iso_mapped + '.h5'),
+            'compressed': _file_size(
+                iso_compressed + '.bin', iso_compressed + '.h5'),
+        }
+        benchmark(stores, sizes, shelf.keys()[:2000])
@@ -0,0 +1,92 @@
+"""
+Background jobs of a dashboard session.
+
+Each job has a kind (e.g. 'generate' or an isotherm plot) and only the
+latest job of a kind counts: submitting a new one cancels the previous
+one. Jobs run in a small thread pool per session, so a session cannot
+use more than a few server threads however often it clicks.
+"""
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+
+class Job():
+    """
+    A scheduled background call.
+
+    Long-running jobs should check `cancelled` between steps and stop
+    early, and results should only be applied if the job is still current.
+    """
+
+    def __init__(self, kind, generation):
+
+        self.kind = kind
+        self.generation = generation
+        self._cancelled = Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class JobScheduler():
+    """
+    Latest-wins scheduling of background jobs.
+
+    `max_jobs` caps the number of jobs running at once, others wait in a
+    queue and are skipped if superseded before they start.
+    """
+
+    def __init__(self, max_jobs=2):
+
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self._latest = {}               # kind -> Job
+        self._lock = Lock()
+        self.generation = 0
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Run `func(job, *args, **kwargs)`, superseding jobs of its kind."""
+        with self._lock:
+            self.generation += 1
+            job = Job(kind, self.generation)
+            previous = self._latest.get(kind)
+            if previous is not None:
+                previous.cancel()
+            self._latest[kind] = job
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def cancel(self, *kinds):
+        """Cancel the current jobs of some kinds."""
+        with self._lock:
+            for kind in kinds:
+                job = self._latest.pop(kind, None)
+                if job is not None:
+                    job.cancel()
+
+    def is_current(self, job):
+        """Whether the job is the latest of its kind and not cancelled."""
+        with self._lock:
+            return self._latest.get(job.kind) is job and not job.cancelled
+
+    def shutdown(self):
+        """Cancel all jobs and release the threads."""
+        with self._lock:
+            jobs, self._latest = list(self._latest.values()), {}
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _run(job, func, args, kwargs):
+        if job.cancelled:
+            return
+        try:
+            func(job, *args, **kwargs)
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,56 @@
+"""
+Level of detail of the KPI scatter plots.
+
+With thousands of materials, drawing every point of the three linked
+plots makes the browser the bottleneck. Instead, only the points in the
+visible part of a plot are drawn, and if there are still too many, the
+viewport is divided in a grid and a single point per cell is kept.
+The data of all points are still sent to the browser, only the drawing
+is reduced.
+"""
+import numpy as np
+
+
+def _in_range(values, bounds):
+    """Mask of values within (start, end) bounds, if they are known."""
+    if bounds is None:
+        return np.ones(len(values), dtype=bool)
+    start, end = bounds
+    if start is None or end is None or np.isnan(start) or np.isnan(end):
+        return np.ones(len(values), dtype=bool)
+    low, high = min(start, end), max(start, end)
+    return (values >= low) & (values <= high)
+
+
+def decimate(x, y, max_points, x_range=None, y_range=None,
+             weight=None, keep=()):
+    """
+    Indices of the points to draw in a viewport.
+
+    At most about `max_points` points are drawn, the one with the largest
+    `weight` in each grid cell, and the `keep` points are always drawn.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    visible = np.isfinite(x) & np.isfinite(y) & \
+        _in_range(x, x_range) & _in_range(y, y_range)
+    found = np.flatnonzero(visible)
+
+    if len(found) > max_points:
+        if weight is not None:
+            found = found[np.argsort(
+                -np.asarray(weight, dtype=float)[found], kind='stable')]
+
+        n = max(int(np.sqrt(max_points)), 1)
+        cells = np.zeros(len(found), dtype=int)
+        for values in (x[found], y[found]):
+            low, high = values.min(), values.max()
+            scale = n / (high - low) if high > low else 0
+            cells = cells * n + np.minimum(
+                ((values - low) * scale).astype(int), n - 1)
+
+        # First, heaviest, point of each occupied cell
+        _, first = np.unique(cells, return_index=True)
+        found = found[first]
+
+    return np.union1d(found, np.asarray(keep, dtype=int))
@@ -0,0 +1,151 @@
+"""
+Dense KPI arrays of an adsorbate pair.
+
+A pair selection is converted once into contiguous [material x pressure]
+arrays of med, size and err for each adsorbate, so that moving a pressure
+slider is a column slice rather than a MultiIndex lookup. New data sent
+to the browser are float arrays, which Bokeh encodes in binary; slider
+patches are still sent as JSON lists.
+"""
+import copy
+
+import numpy as np
+
+SIDES = ('x', 'y')
+
+
+def error_segments(kpi, x, y, ex, ey):
+    """
+    Error bars of points, as two segments (rows) per point.
+
+    Points with a missing coordinate are drawn at the origin without bars.
+    """
+    missing = np.isnan(x) | np.isnan(y)
+    x, y, ex, ey = (np.where(missing, 0, a) for a in (x, y, ex, ey))
+    return {
+        f'{kpi}_x': np.repeat(x, 2), f'{kpi}_y': np.repeat(y, 2),
+        f'{kpi}_x0': np.column_stack((x - ex, x)).ravel(),
+        f'{kpi}_y0': np.column_stack((y, y - ey)).ravel(),
+        f'{kpi}_x1': np.column_stack((x + ex, x)).ravel(),
+        f'{kpi}_y1': np.column_stack((y, y + ey)).ravel(),
+    }
+
+
+class KPIMatrix():
+    """
+    KPI of a pair selection as float arrays.
+
+    Column `i` of the pressure arrays is the KPI at pressure `i / 2` bar,
+    matching the KPI column names, and column 0 is zero pressure where
+    everything is zero.
+    """
+
+    def __init__(self, dfs):
+
+        self.labels = dfs.index.to_numpy()
+
+        pressures = dfs.columns.get_level_values(0)
+        n_p = max(int(c[:-2]) for c in pressures if c[:-2].isdigit())
+
+        self.k_med, self.k_size, self.k_err = {}, {}, {}
+        self.med, self.size, self.err = {}, {}, {}
+        for side in SIDES:
+            columns = [f'{p}_{side}' for p in range(1, n_p + 1)]
+            for stat, henry, loading in (
+                    ('med', self.k_med, self.med),
+                    ('size', self.k_size, self.size),
+                    ('err', self.k_err, self.err)):
+                henry[side] = dfs[(f'kH_{side}', stat)].to_numpy(float)
+                array = np.zeros((len(dfs), n_p + 1))
+                array[:, 1:] = dfs.loc[
+                    :, [(c, stat) for c in columns]].to_numpy(float)
+                loading[side] = array
+
+        self.sel = np.exp(self.k_med['y'] - self.k_med['x'])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def take(self, rows):
+        """The KPI of some rows, in the given order."""
+        kpi = copy.copy(self)
+        kpi.labels = self.labels[rows]
+        for name in ('k_med', 'k_size', 'k_err', 'med', 'size', 'err'):
+            setattr(kpi, name, {
+                side: values[rows]
+                for side, values in getattr(self, name).items()})
+        kpi.sel = self.sel[rows]
+        return kpi
+
+    def flat(self):
+        """Pressure arrays flattened row by row, for use in the browser."""
+        return {
+            f'{stat}_{side}': getattr(self, stat)[side].ravel()
+            for stat in ('med', 'size', 'err') for side in SIDES
+        }
+
+    def henry(self):
+        """Henry coefficient data."""
+        return {
+            'sel': self.sel,
+            'K_x': self.k_med['x'], 'K_y': self.k_med['y'],
+            'K_nx': self.k_size['x'], 'K_ny': self.k_size['y'],
+            'K_n': self.k_size['x'] + self.k_size['y'],
+        }
+
+    def loading(self, lp):
+        """Loading data at a pressure column name."""
+        p = int(lp)
+        L_nx, L_ny = self.size['x'][:, p], self.size['y'][:, p]
+        return {
+            'L_x': self.med['x'][:, p], 'L_y': self.med['y'][:, p],
+            'L_nx': L_nx, 'L_ny': L_ny, 'L_n': L_nx + L_ny,
+        }
+
+    def working_capacity(self, p1, p2):
+        """Working capacity data between two pressure column names."""
+        p1, p2 = int(p1), int(p2)
+        W_x = self.med['x'][:, p2] - self.med['x'][:, p1]
+        W_y = self.med['y'][:, p2] - self.med['y'][:, p1]
+        W_nx = np.maximum(self.size['x'][:, p1], self.size['x'][:, p2])
+        W_ny = np.maximum(self.size['y'][:, p1], self.size['y'][:, p2])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            psa_W = (W_y / W_x) * self.sel
+        return {
+            'psa_W': psa_W,
+            'W_x': W_x, 'W_y': W_y,
+            'W_nx': W_nx, 'W_ny': W_ny, 'W_n': W_nx + W_ny,
+        }
+
+    def henry_errors(self, rows):
+        """Henry coefficient error bars of some rows."""
+        return error_segments(
+            'K', self.k_med['x'][rows], self.k_med['y'][rows],
+            self.k_err['x'][rows], self.k_err['y'][rows])
+
+    def loading_errors(self, rows, lp):
+        """Loading error bars of some rows."""
+        p = int(lp)
+        return error_segments(
+            'L', self.med['x'][rows, p], self.med['y'][rows, p],
+            self.err['x'][rows, p], self.err['y'][rows, p])
+
+    def working_capacity_errors(self, rows, p1, p2):
+        """Working capacity error bars of some rows."""
+        p1, p2 = int(p1), int(p2)
+        med, err = self.med, self.err
+        return error_segments(
+            'W',
+            med['x'][rows, p2] - med['x'][rows, p1],
+            med['y'][rows, p2] - med['y'][rows, p1],
+            err['x'][rows, p1],
+            err['y'][rows, p1])
+
+    def metrics(self, lp, p1, p2):
+        """All KPI data of the pair."""
+        return {
+            'labels': self.labels,
+            **self.henry(),
+            **self.loading(lp),
+            **self.working_capacity(p1, p2),
+        }
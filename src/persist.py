@@ -0,0 +1,201 @@
+"""
+On-disk store of computed pair selections.
+
+Pair selections are saved as they are computed and read back into the
+result cache when the server starts, so that the default selection and
+the popular ones are not recomputed after a restart. Entries are kept
+in a directory named after a content hash of `kpi.h5`, and directories
+of other versions of the dataset are removed when the store is opened,
+so results are never served from a dataset which has since changed. The
+hash is kept with the size and modification time of `kpi.h5`, and only
+computed again when they change.
+
+Several server processes may share the store: entries are written to a
+temporary file first and renamed, so readers never see partial files.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+
+import numpy as np
+
+from src.snapshot import source_stamp
+
+
+def file_digest(path, chunk=2**20):
+    """Content hash of a file, None if it is missing."""
+    if not Path(path).exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def cached_digest(path, cache):
+    """
+    Content hash of a file, kept in the `cache` file with the size and
+    modification time of the file, so that it is only computed again
+    once the file changes. None if the file is missing.
+    """
+    stamp = source_stamp(path)
+    if stamp is None:
+        return None
+    cache = Path(cache)
+    try:
+        with open(cache, 'r') as file:
+            saved = json.load(file)
+        if saved['source'] == stamp:
+            return saved['digest']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = file_digest(path)
+    temp = cache.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        with open(temp, 'w') as file:
+            json.dump({'source': stamp, 'digest': digest}, file)
+        os.replace(temp, cache)
+    except OSError as e:
+        print(f'Dataset digest not saved: {e}')
+    return digest
+
+
+def _strings(values):
+    """Strings as a unicode array, which is saved without pickling."""
+    return np.asarray(values, dtype=str)
+
+
+class SelectionStore():
+    """
+    Pair selections of one dataset, saved in `root`.
+
+    `digest` identifies the dataset, and `variant` the settings the
+    selections depend on, such as the KPI engine. Selections are saved
+    as packed by `pack_kpi`, one `.npz` file per selection key, by a
+    background thread so that requests do not wait for the disk.
+    """
+
+    def __init__(self, root, digest, variant):
+
+        self.root = Path(root)
+        self.path = self.root / digest / variant
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # Selections of other versions of the dataset are stale
+        for old in self.root.iterdir():
+            if old.is_dir() and old.name != digest:
+                shutil.rmtree(old, ignore_errors=True)
+
+        self.saved = 0                  # Selections saved
+        self.loaded = 0                 # Selections loaded
+        self.removed = 0                # Selections over the size limit
+
+        self._queue = Queue()           # (key, packed) to write
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _file(self, key):
+        name = json.dumps(key, default=float)
+        return self.path / (hashlib.sha1(name.encode()).hexdigest() + '.npz')
+
+    def save(self, key, packed):
+        """Queue a packed selection, or None if the pair has no materials."""
+        self._queue.put((key, packed))
+
+    def flush(self):
+        """Wait until the queued selections are written."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key, packed = self._queue.get()
+            try:
+                self._write(key, packed)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, key, packed):
+        path = self._file(key)
+        temp = path.with_suffix(f'.{os.getpid()}.tmp')
+        arrays = {'key': np.array(json.dumps(key, default=float))}
+        if packed is not None:
+            index, values, columns = packed
+            arrays.update(
+                index=_strings(index), values=values,
+                columns=_strings(columns))
+        try:
+            with open(temp, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(temp, path)
+            self.saved += 1
+        except OSError as e:
+            print(f'Selection not saved: {e}')
+
+    def touch(self, keys):
+        """Mark selections as used, in order from least to most recent."""
+        for key in keys:
+            try:
+                os.utime(self._file(key))
+            except OSError:
+                pass
+
+    def load(self, max_bytes):
+        """
+        Saved (key, packed) selections, most recently used first.
+
+        Selections which would take the values over `max_bytes` are
+        removed, as are unreadable files.
+        """
+        files = []
+        for path in self.path.glob('*.npz'):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+
+        result, total = [], 0
+        for _, path in sorted(files, reverse=True):
+            try:
+                with np.load(path) as data:
+                    key = tuple(json.loads(str(data['key'])))
+                    packed = None
+                    if 'values' in data:
+                        packed = (
+                            data['index'].astype(object), data['values'],
+                            [tuple(c) for c in data['columns'].tolist()])
+            except (OSError, ValueError, KeyError):
+                self._remove(path)
+                continue
+
+            size = packed[1].nbytes if packed is not None else 0
+            if total + size > max_bytes:
+                self._remove(path)
+                self.removed += 1
+                continue
+            total += size
+            result.append((key, packed))
+
+        self.loaded += len(result)
+        return result
+
+    @staticmethod
+    def _remove(path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def stats(self):
+        """Store counters."""
+        return {
+            'saved': self.saved,
+            'loaded': self.loaded,
+            'removed': self.removed,
+        }
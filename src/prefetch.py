@@ -0,0 +1,100 @@
+"""
+Prefetching of isotherms into the isotherm cache.
+
+When a material is hovered, or scrolled into view in the material table,
+its isotherms are likely to be requested by a click soon after. A single
+background thread of the server reads them into the `CachedStore` ahead
+of time. Each session has at most one pending request, which a newer
+hover replaces. Requests are served newest first, and the isotherms read
+are limited to a rate so that prefetching stays in the background.
+"""
+import time
+import traceback
+from collections import OrderedDict
+from threading import Condition, Thread
+
+
+class Prefetcher():
+    """
+    Warm a `CachedStore` with isotherms in a background thread.
+
+    `rate` is the largest number of isotherms read per second.
+    """
+
+    def __init__(self, store, rate=100):
+
+        self.store = store
+        self.interval = 1 / rate
+
+        self._pending = OrderedDict()   # owner -> function giving keys
+        self._cond = Condition()
+
+        self.requests = 0               # Requests made
+        self.served = 0                 # Requests served
+        self.cancelled = 0              # Requests replaced or cancelled
+        self.read = 0                   # Isotherms read
+        self.clicks = 0                 # Clicks recorded
+        self.warm_clicks = 0            # Clicks with all isotherms cached
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, owner, keys):
+        """
+        Queue isotherms to warm, replacing the owner's pending request.
+
+        `keys` is a function returning the isotherm keys, called in the
+        background thread.
+        """
+        with self._cond:
+            if self._pending.pop(owner, None) is not None:
+                self.cancelled += 1
+            self._pending[owner] = keys
+            self.requests += 1
+            self._cond.notify()
+
+    def cancel(self, owner):
+        """Drop the pending request of an owner."""
+        with self._cond:
+            if self._pending.pop(owner, None) is not None:
+                self.cancelled += 1
+
+    def record_click(self, keys):
+        """Count a click, warm if all its isotherms are cached."""
+        if not keys:
+            return
+        with self._cond:
+            self.clicks += 1
+            if all(key in self.store.cache for key in keys):
+                self.warm_clicks += 1
+
+    def stats(self):
+        """Prefetch counters."""
+        with self._cond:
+            return {
+                'requests': self.requests,
+                'served': self.served,
+                'cancelled': self.cancelled,
+                'read': self.read,
+                'clicks': self.clicks,
+                'warm_share': (
+                    self.warm_clicks / self.clicks if self.clicks else 0),
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                _, keys = self._pending.popitem(last=True)
+
+            try:
+                keys = self.store.warm(keys())
+            except Exception:
+                traceback.print_exc()
+                keys = []
+
+            with self._cond:
+                self.served += 1
+                self.read += len(keys)
+            time.sleep(len(keys) * self.interval)
@@ -0,0 +1,127 @@
+"""
+Offline screening of every adsorbate pair.
+
+Each pair of probes is evaluated at a given temperature like a "Generate"
+click on the dashboard, and all materials are ranked by their Henry
+selectivity (`sel`) and PSA-API (`psa_W`). Pairs are sharded by their
+first adsorbate across a process pool, so each worker computes the KPI
+table of an adsorbate once and reuses it for all its pairs.
+
+Run from the repository root, for example::
+
+    python -m src.screen --t-abs 303 --t-tol 5 --procs 4 \\
+        --out data/screen-303K.h5
+"""
+import argparse
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+import src.datastore
+from src.matrix import KPIMatrix
+
+METRICS = ['sel', 'psa_W', 'K_nx', 'K_ny', 'L_nx', 'L_ny', 'W_nx', 'W_ny']
+
+
+def _init_worker():
+    """Load the dataset in workers which did not inherit it."""
+    if src.datastore.CUBE is None:
+        src.datastore.load()
+
+
+def screen_pairs(task):
+    """Rank the materials of all (g1, g2) pairs for a single g1."""
+    g1, g2s, i_type, t_abs, t_tol, lp, p1, p2 = task
+
+    tables = []
+    for g2 in g2s:
+        dfs = src.datastore.select_pair(i_type, t_abs, t_tol, g1, g2)
+        if dfs is None:
+            continue
+        kpi = KPIMatrix(dfs)
+        metrics = kpi.metrics(lp, p1, p2)
+        table = pd.DataFrame(
+            {m: metrics[m] for m in METRICS},
+            index=pd.Index(kpi.labels, name=dfs.index.name))
+        table.insert(0, 'g2', g2)
+        table.insert(0, 'g1', g1)
+        table['sel_rank'] = table['sel'].rank(
+            ascending=False, method='min')
+        table['psa_W_rank'] = table['psa_W'].rank(
+            ascending=False, method='min')
+        tables.append(table.reset_index())
+
+    return tables
+
+
+def screen(probes, i_type, t_abs, t_tol, lp, p1, p2, procs=None):
+    """Screen all pairs of probes and return one ranked table."""
+    tasks = [
+        (g1, probes[i + 1:], i_type, t_abs, t_tol, lp, p1, p2)
+        for i, g1 in enumerate(probes[:-1])
+    ]
+
+    # Largest shards first to balance the workers
+    tasks.sort(key=lambda task: len(task[1]), reverse=True)
+    with Pool(processes=procs, initializer=_init_worker) as pool:
+        tables = [
+            table
+            for result in pool.imap_unordered(screen_pairs, tasks)
+            for table in result
+        ]
+
+    if not tables:
+        return None
+
+    return pd.concat(tables, ignore_index=True).sort_values(
+        ['g1', 'g2', 'psa_W_rank', 'sel_rank']).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Screen all adsorbate pairs at a temperature.')
+    parser.add_argument('--t-abs', type=float, default=303)
+    parser.add_argument('--t-tol', type=float, default=5)
+    parser.add_argument('--type', choices=['exp', 'sim'], default=None,
+                        help='isotherm type, all by default')
+    parser.add_argument('--pressure', type=float, default=0.5,
+                        help='uptake pressure (bar)')
+    parser.add_argument('--wc', type=float, nargs=2, default=(0.5, 5),
+                        help='working capacity pressure range (bar)')
+    parser.add_argument('--procs', type=int, default=None,
+                        help='worker processes, all cores by default')
+    parser.add_argument('--out', default='data/screen.h5',
+                        help='output file, .h5 or .parquet')
+    args = parser.parse_args()
+
+    # Every pair is computed once, not worth saving for the server
+    src.datastore.PERSIST_RESULTS = False
+    src.datastore.load()
+    probes = src.datastore.PROBES
+    n_pairs = len(probes) * (len(probes) - 1) // 2
+
+    start = time.time()
+    result = screen(
+        probes, args.type, args.t_abs, args.t_tol,
+        str(int(2 * args.pressure)),
+        str(int(2 * args.wc[0])), str(int(2 * args.wc[1])),
+        procs=args.procs)
+    elapsed = time.time() - start
+
+    print(f'Screened {n_pairs} pairs in {elapsed:.1f} s '
+          f'({n_pairs / elapsed:.1f} pairs/s).')
+
+    if result is None:
+        print('No pair has materials in common.')
+        return
+
+    if args.out.endswith('.parquet'):
+        result.to_parquet(args.out)
+    else:
+        result.to_hdf(args.out, key='screen', mode='w')
+    print(f'{len(result)} ranked materials written to {args.out}.')
+
+
+if __name__ == '__main__':
+    main()
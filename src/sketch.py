@@ -0,0 +1,216 @@
+"""
+Mergeable quantile sketches of the KPI cube.
+
+Each (ads, type, temperature bin, mat) cell of the cube is summarised,
+for each KPI column, by at most `k` centroids. A centroid holds the mean,
+the number and the sum of squared deviations of a run of consecutive
+sorted values. Cells with `k` values or fewer keep one centroid per value
+and are therefore exact. Larger cells are split into `k` runs of equal
+size.
+
+Sketches of neighbouring bins merge by pooling their centroids, and the
+`stats` of a material are then computed from the pooled centroids alone:
+
+* `size` is always exact.
+* A quantile is interpolated between centroid centres. Its rank differs
+  from the exact rank by less than `2 / k` of the group size, however
+  many cells are merged, and it is exact if no merged cell was
+  compressed.
+* Outlier trimming drops whole centroids, so only a centroid straddling
+  the trimming limit can be misplaced.
+* `err` is the exact standard deviation of the values in the kept
+  centroids.
+
+Unlike the exact path, the edge bins of a window are included wholesale:
+all isotherms of an integer temperature bin which overlaps the window are
+counted, even those just outside it. Results can therefore only match
+the exact path for windows made of whole bins.
+
+Sketches save time, not memory. A centroid is three float64 values,
+while the dataset may hold float32 values, so cells of `k` values or
+fewer take up to six times their size in the dataset. `tests/test_sketch.py`
+checks the accuracy bounds above.
+"""
+import numpy as np
+import pandas as pd
+
+from src.statistics import KPI_STATS
+
+
+def _segments(codes, n_groups):
+    """Start and stop positions of each group in sorted codes."""
+    starts = np.searchsorted(codes, np.arange(n_groups), side='left')
+    stops = np.searchsorted(codes, np.arange(n_groups), side='right')
+    return starts, stops
+
+
+def _weighted_quantile(codes, mean, weight, n_groups, q):
+    """
+    Quantile of each group of centroids sorted by (group, mean).
+
+    With unit weights this is the linear interpolation of `np.percentile`.
+    """
+    result = np.full(n_groups, np.nan)
+    if len(mean) == 0:
+        return result
+
+    total = np.bincount(codes, weight, minlength=n_groups)
+    starts, stops = _segments(codes, n_groups)
+    cum = np.concatenate(([0], np.cumsum(weight)))
+    before = cum[:-1] - np.repeat(cum[starts], stops - starts)
+    centre = before + (weight - 1) / 2
+
+    # Offset each group so all centres can be searched at once
+    span = total.max() + 1
+    centre = centre + codes * span
+    target = (total - 1) * q + np.arange(n_groups) * span
+
+    upper = np.searchsorted(centre, target, side='left')
+    upper = np.clip(upper, starts, np.maximum(stops - 1, starts))
+    # Groups without centroids, at the end, start past the last centroid
+    upper = np.minimum(upper, len(mean) - 1)
+    lower = np.minimum(np.maximum(upper - 1, starts), len(mean) - 1)
+
+    gap = centre[upper] - centre[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(gap > 0, (target - centre[lower]) / gap, 1)
+    frac = np.clip(frac, 0, 1)
+
+    found = total > 0
+    result[found] = (mean[lower] * (1 - frac) + mean[upper] * frac)[found]
+    return result
+
+
+def centroid_stats(codes, mean, weight, m2, n_groups):
+    """
+    Sketch equivalent of `src.statistics.stats` for groups of centroids.
+
+    Centroids must be sorted by (group, mean). Returns size, med and err.
+    """
+    size = np.bincount(codes, weight, minlength=n_groups)
+
+    # IQR outlier removal for groups of more than 4 values
+    q1 = _weighted_quantile(codes, mean, weight, n_groups, 0.25)
+    q3 = _weighted_quantile(codes, mean, weight, n_groups, 0.75)
+    iqr = q3 - q1
+    with np.errstate(invalid='ignore'):
+        keep = (size[codes] <= 4) | \
+            (q1[codes] - 1.5 * iqr[codes] < mean) | \
+            (mean > q3[codes] + 1.5 * iqr[codes])
+    codes, mean, weight, m2 = codes[keep], mean[keep], weight[keep], m2[keep]
+
+    med = _weighted_quantile(codes, mean, weight, n_groups, 0.5)
+
+    # Pooled population variance of the kept centroids
+    kept = np.bincount(codes, weight, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = np.bincount(codes, weight * mean, minlength=n_groups) / kept
+        var = (np.bincount(codes, m2, minlength=n_groups) +
+               np.bincount(codes, weight * (mean - avg[codes]) ** 2,
+                           minlength=n_groups)) / kept
+    err = np.sqrt(var)
+    err[size == 0] = 0
+
+    return size, med, err
+
+
+class KPISketches():
+    """
+    Quantile sketches of every cell and KPI column of a `KPICube`.
+
+    Centroids of each column are stored in flat arrays sorted by cell and
+    mean, with `offsets[column]` marking where each cell starts.
+    """
+
+    def __init__(self, mats, first, columns, offsets, mean, weight, m2, k):
+
+        self.mats = mats            # Material of each cell
+        self.first = first          # Dataset order of each cell
+        self.columns = columns      # KPI columns
+        self.offsets = offsets      # Per column, cell start positions
+        self.mean = mean            # Per column, centroid means
+        self.weight = weight        # Per column, centroid sizes
+        self.m2 = m2                # Per column, centroid squared deviations
+        self.k = k
+
+    @property
+    def nbytes(self):
+        """Memory held by the centroids and their offsets."""
+        return self.mats.nbytes + self.first.nbytes + sum(
+            array.nbytes
+            for arrays in (self.offsets, self.mean, self.weight, self.m2)
+            for array in arrays.values())
+
+    @classmethod
+    def from_cube(cls, cube, k=64):
+        """Build the sketches of all cells of a cube."""
+        cells = cube.cells
+        n_cells = len(cells)
+        sizes = (cells['stop'] - cells['start']).to_numpy()
+        cell = np.repeat(np.arange(n_cells), sizes)
+
+        columns = cube.data.columns.drop(['mat', 'ads', 't', 'type'])
+        offsets, means, weights, m2s = {}, {}, {}, {}
+
+        for column in columns:
+            values = cube.data[column].to_numpy(dtype=float)[cube.positions]
+            valid = ~np.isnan(values)
+            order = np.lexsort((values[valid], cell[valid]))
+            vals, owner = values[valid][order], cell[valid][order]
+
+            # Rank of each value in its cell, large cells are bucketed
+            counts = np.bincount(owner, minlength=n_cells)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            rank = np.arange(len(vals)) - starts[owner]
+            bucket = np.where(
+                counts[owner] > k, rank * k // np.maximum(counts[owner], 1),
+                rank)
+
+            new = np.ones(len(vals), dtype=bool)
+            new[1:] = (owner[1:] != owner[:-1]) | (bucket[1:] != bucket[:-1])
+            bounds = np.flatnonzero(new)
+
+            if len(bounds):
+                weight = np.diff(np.append(bounds, len(vals))).astype(float)
+                mean = np.add.reduceat(vals, bounds) / weight
+                dev = (vals - np.repeat(mean, weight.astype(int))) ** 2
+                m2 = np.add.reduceat(dev, bounds)
+            else:
+                weight = mean = m2 = np.zeros(0)
+
+            offsets[column] = np.searchsorted(
+                owner[bounds], np.arange(n_cells + 1), side='left')
+            means[column], weights[column], m2s[column] = mean, weight, m2
+
+        mats = cells['mat'].to_numpy()
+        first = cube.positions[cells['start'].to_numpy()]
+        return cls(mats, first, columns, offsets, means, weights, m2s, k)
+
+    def kpi(self, cell_ids):
+        """Per-material KPI of a set of cells, like `group_kpi`."""
+        cell_ids = cell_ids[np.argsort(self.first[cell_ids])]
+        codes, groups = pd.factorize(self.mats[cell_ids], sort=False)
+        groups = pd.Index(groups, name='mat')
+        n_groups = len(groups)
+
+        result = np.empty((n_groups, len(self.columns), len(KPI_STATS)))
+        for i, column in enumerate(self.columns):
+            starts = self.offsets[column][cell_ids]
+            counts = self.offsets[column][cell_ids + 1] - starts
+
+            # Gather the centroids of the cells, sorted by (group, mean)
+            take = np.repeat(starts - np.cumsum(counts) + counts, counts) + \
+                np.arange(counts.sum())
+            owner = np.repeat(codes, counts)
+            mean = self.mean[column][take]
+            order = np.lexsort((mean, owner))
+
+            result[:, i, :] = np.stack(centroid_stats(
+                owner[order], mean[order],
+                self.weight[column][take][order],
+                self.m2[column][take][order],
+                n_groups), axis=-1)
+
+        return pd.DataFrame(
+            result.reshape(n_groups, -1), index=groups,
+            columns=pd.MultiIndex.from_product([self.columns, KPI_STATS]))
@@ -0,0 +1,157 @@
+"""
+Binary snapshot of the frames read at server startup.
+
+Reading `kpi.h5` and `kpi-cube.h5` through PyTables, and unpickling their
+string columns, is most of the startup time. A snapshot holds the same
+frames as one `.npy` file per column, string columns being stored as
+categorical codes and categories, so that they are read back with
+`np.load` alone.
+
+A snapshot records the content hash of the `kpi.h5` it was made from,
+and is ignored once that file changes. A copy of the same file, as made
+by a checkout or a deployment, is still accepted. It is written with
+`python -m src.snapshot`, after the cube if there is one.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+META = 'meta.json'
+
+
+def source_stamp(source):
+    """Size and modification time of a file, None if it is missing."""
+    source = Path(source)
+    if not source.exists():
+        return None
+    stat = source.stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def source_digest(source):
+    """
+    Content hash of a file, None if it is missing.
+
+    The hash is kept next to the file, in `<name>.digest.json`, and only
+    computed again once the size or modification time of the file change.
+    """
+    from src.persist import cached_digest
+    source = Path(source)
+    cache = source.with_name(source.name + '.digest.json')
+    return cached_digest(source, cache)
+
+
+def _strings(values):
+    """Strings as a unicode array, which is saved without pickling."""
+    if pd.api.types.is_string_dtype(values):
+        return np.asarray(values, dtype=str)
+    return np.asarray(values)
+
+
+def _objects(values):
+    """Unicode arrays back to the object arrays pandas uses."""
+    return values.astype(object) if values.dtype.kind == 'U' else values
+
+
+def write_frame(frame, path):
+    """Write a frame as one `.npy` file per column, with its index."""
+    path.mkdir(parents=True, exist_ok=True)
+
+    columns = []
+    for i, (name, values) in enumerate(frame.items()):
+        kind = 'values'
+        if pd.api.types.is_categorical_dtype(values):
+            kind = 'category'
+        elif pd.api.types.is_string_dtype(values):
+            kind, values = 'strings', values.astype('category')
+        if kind != 'values':
+            np.save(path / f'{i}-categories.npy',
+                    _strings(values.cat.categories))
+            values = values.cat.codes
+        np.save(path / f'{i}.npy', values.to_numpy())
+        columns.append({'name': name, 'kind': kind,
+                        'dtype': str(frame.dtypes[name])})
+
+    np.save(path / 'index.npy', _strings(frame.index))
+
+    return {'columns': columns, 'index': str(frame.index.dtype)}
+
+
+def read_frame(path, meta, categories=False):
+    """
+    Read a frame written with `write_frame`.
+
+    String columns are returned as categoricals if `categories` is set,
+    otherwise with the dtype they were written with.
+    """
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        values = np.load(path / f'{i}.npy')
+        if column['kind'] != 'values':
+            values = pd.Categorical.from_codes(
+                values, _objects(np.load(path / f'{i}-categories.npy')))
+            if column['kind'] == 'strings' and not categories:
+                values = values.astype(column['dtype'])
+        data[column['name']] = values
+
+    index = pd.Index(
+        _objects(np.load(path / 'index.npy')), dtype=meta['index'])
+
+    return pd.DataFrame(data, index=index,
+                        columns=[c['name'] for c in meta['columns']])
+
+
+def write(path, source, **frames):
+    """Write named frames in a snapshot of the `source` file."""
+    path = Path(path)
+    if (path / META).exists():
+        (path / META).unlink()
+    meta = {'source': source_digest(source), 'frames': {}}
+    for name, frame in frames.items():
+        meta['frames'][name] = write_frame(frame, path / name)
+    # Written last, so that an interrupted write leaves no snapshot
+    with open(path / META, 'w') as file:
+        json.dump(meta, file)
+
+
+def read(path, source, names, categories=False):
+    """
+    Read named frames from a snapshot, if it is up to date.
+
+    Returns None if the snapshot, or one of the frames, is missing, or if
+    `source` changed since the snapshot was written.
+    """
+    path = Path(path)
+    try:
+        with open(path / META, 'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    digest = source_digest(source)
+    if digest is not None and digest != meta.get('source'):
+        print(f'Snapshot {path} is out of date, ignored.')
+        return None
+    if any(name not in meta['frames'] for name in names):
+        return None
+
+    return [
+        read_frame(path / name, meta['frames'][name], categories=categories)
+        for name in names
+    ]
+
+
+if __name__ == '__main__':
+    from src.cube import KPICube
+    from src.helpers import load_data, load_cube, kpi_source, kpi_snapshot
+
+    data = load_data(snapshot=False)
+    cube = load_cube(data, snapshot=False)
+    if cube is None:
+        cube = KPICube.from_frame(data)
+    write(kpi_snapshot, kpi_source, data=data,
+          positions=pd.DataFrame({'position': cube.positions}),
+          cells=cube.cells)
+    print(f'Snapshot written to {kpi_snapshot}.')
@@ -0,0 +1,102 @@
+"""
+Incremental updates of Bokeh data sources.
+
+Replacing `source.data` sends every column to the browser again. When new
+data only differ from the current contents in some rows, for example after
+a small change of temperature tolerance, the changed values are sent as a
+patch instead, and added rows are streamed. Rows are matched on their
+label, so the rows of the new data are first put in the order of the
+current ones.
+"""
+import numpy as np
+import pandas as pd
+
+PATCH_THRESHOLD = 0.25      # Largest share of changed values to patch
+
+
+def changed_rows(old, new):
+    """Positions where two columns of the same length differ."""
+    old, new = np.asarray(old), np.asarray(new)
+    if old.dtype.kind == 'f' and new.dtype.kind == 'f':
+        same = (old == new) | (np.isnan(old) & np.isnan(new))
+    else:
+        same = old == new
+    return np.flatnonzero(~same)
+
+
+def align_rows(old, new):
+    """
+    Order of the `new` keys which keeps the `old` ones in place.
+
+    Keys found in both are put at their old positions, followed by the
+    added keys in their order. Returns None if keys were removed, since
+    rows cannot be removed from a source without replacing its data.
+    """
+    old, new = pd.Index(old), pd.Index(new)
+    if not old.is_unique or not new.is_unique:
+        return None
+    kept = new.get_indexer(old)
+    if (kept < 0).any():
+        return None
+    added = np.setdiff1d(np.arange(len(new)), kept)
+    return np.concatenate([kept, added]).astype(int)
+
+
+def diff_data(old, new, key='labels'):
+    """
+    Patches and streamed rows turning the `old` columns into the `new` ones.
+
+    The `new` rows, identified by the `key` column, must start with the
+    `old` ones in the same order (see `align_rows`); the rows after them
+    are streamed. Returns None if they do not, or if the columns differ,
+    as the data must then be replaced.
+    """
+    if set(old) != set(new):
+        return None
+    n_old, n_new = len(old[key]), len(new[key])
+    if n_new < n_old or len(changed_rows(old[key], new[key][:n_old])):
+        return None
+
+    patches, streams = {}, {}
+    for column, values in new.items():
+        if len(old[column]) != n_old or len(values) != n_new:
+            return None
+        rows = changed_rows(old[column], values[:n_old])
+        if len(rows) == n_old and n_old:
+            patches[column] = [(slice(None), values[:n_old])]
+        elif len(rows):
+            patches[column] = [(int(i), values[i]) for i in rows]
+        if n_new > n_old:
+            streams[column] = values[n_old:]
+    return patches, streams
+
+
+def update_source(source, data, threshold=PATCH_THRESHOLD):
+    """
+    Set new source data, patching the changed values if there are few.
+
+    Rows added after the current ones are streamed with the patch.
+    Returns 'patch', 'replace' or None if nothing changed.
+    """
+    diff = diff_data(source.data, data)
+    if diff is None:
+        source.data = data
+        return 'replace'
+    patches, streams = diff
+    if not patches and not streams:
+        return None
+
+    n_values = sum(len(values) for values in data.values())
+    n_changed = sum(
+        len(patch[0][1]) if isinstance(patch[0][0], slice) else len(patch)
+        for patch in patches.values())
+    n_changed += sum(len(values) for values in streams.values())
+    if n_changed > threshold * n_values:
+        source.data = data
+        return 'replace'
+
+    if patches:
+        source.patch(patches)
+    if streams:
+        source.stream(streams)
+    return 'patch'
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 from contextlib import contextmanager
 
+KPI_STATS = ("size", "med", "err")
+
 
 @contextmanager
 def _group_selection_context(groupby):
@@ -33,7 +35,7 @@ def stats(series):
         med, std = np.median(o_rem), np.std(o_rem)
 
     return pd.Series((size, med, std),
-                     index=(["size", "med", "err"]),
+                     index=KPI_STATS,
                      name=series.name)
 
 
@@ -46,18 +48,143 @@ def calc_kpi(data):
         ).unstack()
 
 
-def select_data(data, i_type, t_abs, t_tol, g1, g2):
-    """Generate two-ads dataframe when selected."""
-    if i_type:
-        dft = data[
-            (data['type'] == i_type) &
-            (data['t'].between(t_abs - t_tol, t_abs + t_tol))
-        ]
+def _segment_take(sorted_vals, starts, offsets):
+    """Pick one value per (group, column) at `starts + offsets`."""
+    rows = np.clip(starts[:, None] + offsets, 0, len(sorted_vals) - 1)
+    cols = np.arange(sorted_vals.shape[1])[None, :]
+    return sorted_vals[rows, cols]
+
+
+def _segment_quantile(sorted_vals, starts, counts, q):
+    """
+    Linear-interpolated quantile of each sorted (group, column) segment.
+
+    Mirrors the weighting used by `np.percentile` so results are identical.
+    """
+    pos = (counts - 1) * q
+    below = np.floor(pos).astype(np.intp)
+    above = np.ceil(pos).astype(np.intp)
+    w_above = pos - below
+    return (_segment_take(sorted_vals, starts, below) * (1 - w_above) +
+            _segment_take(sorted_vals, starts, above) * w_above)
+
+
+def _segment_sum(values, starts):
+    """Sum each contiguous group segment, per column."""
+    return np.add.reduceat(values, starts, axis=0)
+
+
+def calc_kpi_vec(data, by='mat'):
+    """
+    Vectorised version of `calc_kpi`.
+
+    Takes an ungrouped frame with a `by` column and numeric columns and
+    computes the `stats` of every (group, column) pair at once. Rows are
+    sorted into contiguous group segments and values are sorted within
+    each segment (NaN last), so quantiles, medians and outlier trimming
+    become index arithmetic on flat NumPy arrays.
+    """
+    columns = data.columns.drop(by)
+    kpi_columns = pd.MultiIndex.from_product([columns, KPI_STATS])
+
+    if hasattr(data[by], 'cat'):
+        # Group on the integer category IDs, names are looked up once
+        codes, ids = pd.factorize(data[by].cat.codes, sort=False)
+        groups = data[by].cat.categories.take(ids)
     else:
-        dft = data[data['t'].between(t_abs - t_tol, t_abs + t_tol)]
+        codes, groups = pd.factorize(data[by], sort=False)
+    groups = pd.Index(groups, name=by)
+    n_groups = len(groups)
+    if n_groups == 0:
+        return pd.DataFrame(columns=kpi_columns, index=groups, dtype=float)
+
+    # Contiguous segments, one per group, in order of appearance
+    values = data[columns].to_numpy(dtype=float)
+    order = np.argsort(codes, kind='mergesort')
+    codes, values = codes[order], values[order]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    # Sort each column within its segment, NaN values go to the end
+    by_value = np.argsort(values, axis=0, kind='mergesort')
+    by_group = np.argsort(codes[by_value], axis=0, kind='mergesort')
+    values = np.take_along_axis(
+        values, np.take_along_axis(by_value, by_group, axis=0), axis=0)
+
+    valid = ~np.isnan(values)
+    size = _segment_sum(valid.astype(np.intp), starts)
+
+    # IQR outlier removal applies only to groups with more than 4 points,
+    # with the same keep condition as `stats`
+    q1 = _segment_quantile(values, starts, size, 0.25)
+    q3 = _segment_quantile(values, starts, size, 0.75)
+    iqr = q3 - q1
+    low = np.repeat(q1 - 1.5 * iqr, sizes, axis=0)
+    high = np.repeat(q3 + 1.5 * iqr, sizes, axis=0)
+    with np.errstate(invalid='ignore'):
+        dropped = valid & ~((low < values) | (values > high))
+    dropped &= np.repeat(size > 4, sizes, axis=0)
+    removed = _segment_sum(dropped.astype(np.intp), starts)
+    kept = size - removed
+
+    # Median of the kept values (a contiguous run of each segment)
+    med = (_segment_take(values, starts, removed + (kept - 1) // 2) +
+           _segment_take(values, starts, removed + kept // 2)) / 2
+
+    # Population standard deviation of the kept values
+    position = np.arange(len(values)) - np.repeat(starts, sizes)
+    in_kept = ((position[:, None] >= np.repeat(removed, sizes, axis=0)) &
+               (position[:, None] < np.repeat(size, sizes, axis=0)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _segment_sum(np.where(in_kept, values, 0), starts) / kept
+        dev = np.where(
+            in_kept, values - np.repeat(mean, sizes, axis=0), 0) ** 2
+        err = np.sqrt(_segment_sum(dev, starts) / kept)
+
+    med[kept == 0] = np.nan
+    err[size == 0] = 0
+
+    result = np.stack((size, med, err), axis=-1).reshape(n_groups, -1)
+    return pd.DataFrame(result, index=groups, columns=kpi_columns)
+
+
+def group_kpi(data, engine='numpy'):
+    """Compute the per-material KPI of a filtered frame with an engine."""
+    data = data.drop(columns=['type', 't', 'ads'])
+    if engine == 'numpy':
+        return calc_kpi_vec(data, 'mat')
+    elif engine == 'pandas':
+        return calc_kpi(data.groupby('mat', sort=False))
+    raise ValueError(f"Unknown KPI engine '{engine}'.")
+
+
+def filter_data(data, i_type, t_abs, t_tol, ads):
+    """
+    Select the rows of an adsorbate in a temperature window.
+
+    `data` is either the dataset, which is masked, or its `KPICube`,
+    which is sliced.
+    """
+    if not isinstance(data, pd.DataFrame):
+        return data.query(i_type, t_abs, t_tol, ads)
+
+    mask = (data['ads'] == ads) & \
+        (data['t'].between(t_abs - t_tol, t_abs + t_tol))
+    if i_type:
+        mask &= data['type'] == i_type
+    return data[mask]
 
-    g1_filt = dft[dft['ads'] == g1]
-    g2_filt = dft[dft['ads'] == g2]
+
+def select_data(data, i_type, t_abs, t_tol, g1, g2, engine='numpy'):
+    """Generate two-ads dataframe when selected."""
+    return pair_kpi(
+        filter_data(data, i_type, t_abs, t_tol, g1),
+        filter_data(data, i_type, t_abs, t_tol, g2),
+        engine)
+
+
+def pair_kpi(g1_filt, g2_filt, engine='numpy'):
+    """Merge the KPI of two adsorbates on the materials they share."""
     common = list(set(g1_filt['mat'].unique()).intersection(
         g2_filt['mat'].unique()))
 
@@ -65,38 +192,42 @@ def select_data(data, i_type, t_abs, t_tol, g1, g2):
         return None
 
     return pd.merge(
-        calc_kpi(g1_filt[g1_filt['mat'].isin(common)].drop(
-            columns=['type', 't', 'ads']).groupby('mat', sort=False)),
-        calc_kpi(g2_filt[g2_filt['mat'].isin(common)].drop(
-            columns=['type', 't', 'ads']).groupby('mat', sort=False)),
+        group_kpi(g1_filt[g1_filt['mat'].isin(common)], engine),
+        group_kpi(g2_filt[g2_filt['mat'].isin(common)], engine),
         on=('mat'), suffixes=('_x', '_y'))
 
 
-def select_data_single(data, i_type, t_abs, t_tol, g1):
-    """Generate two-ads dataframe when selected."""
-    if i_type:
-        dft = data[
-            (data['type'] == i_type) &
-            (data['t'].between(t_abs - t_tol, t_abs + t_tol))
-        ]
-    else:
-        dft = data[data['t'].between(t_abs - t_tol, t_abs + t_tol)]
+def join_kpi(kpi_1, kpi_2):
+    """Join two single-adsorbate KPI tables on the materials they share."""
+    common = kpi_1.index[kpi_1.index.isin(kpi_2.index)]
 
-    return calc_kpi(dft[dft['ads'] == g1].drop(columns=['type', 't', 'ads']).groupby('mat', sort=False))
+    if len(common) == 0:
+        return None
 
+    return pd.merge(
+        kpi_1.loc[common], kpi_2.loc[common],
+        on=('mat'), suffixes=('_x', '_y'))
 
-def get_isohash(data, i_type, t_abs, t_tol, ads, mat):
 
-    if i_type:
-        dft = data[data['type'] == i_type]
-    else:
-        dft = data
+def swap_kpi(dfs):
+    """Relabel the KPI of a (g1, g2) pair as the KPI of (g2, g1)."""
+    if dfs is None:
+        return None
+    half = dfs.shape[1] // 2
+    swapped = dfs.iloc[:, np.r_[half:2 * half, 0:half]].copy()
+    swapped.columns = dfs.columns
+    return swapped
+
+
+def select_data_single(data, i_type, t_abs, t_tol, g1, engine='numpy'):
+    """Generate two-ads dataframe when selected."""
+    return group_kpi(filter_data(data, i_type, t_abs, t_tol, g1), engine)
+
+
+def get_isohash(data, i_type, t_abs, t_tol, ads, mat):
 
-    return dft[
-        (dft['t'].between(t_abs - t_tol, t_abs + t_tol)) &
-        (dft['ads'] == ads) &
-        (dft['mat'] == mat)
-    ].index
+    dft = filter_data(data, i_type, t_abs, t_tol, ads)
+    return dft[dft['mat'] == mat].index
 
 
 def find_nearest(array, value):
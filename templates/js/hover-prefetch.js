@@ -0,0 +1,9 @@
+// Tell the server which material is hovered, so that it can prefetch
+// its isotherms before the material is clicked.
+const indices = cb_data.index.indices;
+if (indices.length > 0) {
+    const label = source.data['labels'][indices[0]];
+    if (hovered.data['labels'][0] != label) {
+        hovered.data = {'labels': [label]};
+    }
+}
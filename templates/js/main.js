@@ -74,6 +74,14 @@ function toggleLoading() {
     }
 }
 
+function showLoading() {
+    document.getElementById("loading-indicators").style.display = "block";
+}
+
+function hideLoading() {
+    document.getElementById("loading-indicators").style.display = "none";
+}
+
 function startStorIntro() {
     var intro = introJs();
     intro.setOptions({
@@ -130,4 +138,52 @@ function startStorIntro() {
     });
 
     intro.start();
-}
\ No newline at end of file
+}
+// Report the materials scrolled into view in the material table, so that
+// the server can prefetch their isotherms before they are clicked. The
+// Bokeh table has no scroll events, so those of its grid are caught here.
+var prefetchTimer = null;
+
+function prefetchTableRows(viewport) {
+    var doc = Bokeh.documents[0];
+    var source = doc.get_model_by_name('kpi-data');
+    var prefetch = doc.get_model_by_name('prefetch');
+    if (source == null || prefetch == null) {
+        return;
+    }
+    var labels = new Set(source.data['labels']);
+    var top = viewport.scrollTop;
+    var bottom = top + viewport.clientHeight;
+    var visible = [];
+    var rows = viewport.querySelectorAll('.slick-row');
+    for (var i = 0; i < rows.length; i++) {
+        var row = rows[i];
+        if (row.offsetTop + row.offsetHeight <= top || row.offsetTop >= bottom) {
+            continue;
+        }
+        // The material is the cell holding a known label
+        var cells = row.querySelectorAll('.slick-cell');
+        for (var j = 0; j < cells.length; j++) {
+            if (labels.has(cells[j].textContent)) {
+                visible.push(cells[j].textContent);
+                break;
+            }
+        }
+    }
+    if (visible.length > 0) {
+        prefetch.data = {'labels': visible};
+    }
+}
+
+document.addEventListener('scroll', function (event) {
+    var viewport = event.target;
+    if (!viewport.classList || !viewport.classList.contains('slick-viewport') ||
+            viewport.closest('.t-details') === null) {
+        return;
+    }
+    // Only once scrolling stops
+    clearTimeout(prefetchTimer);
+    prefetchTimer = setTimeout(function () {
+        prefetchTableRows(viewport);
+    }, 200);
+}, true);
@@ -0,0 +1,74 @@
+// Recompute the uptake (kpi == 'L') or working capacity (kpi == 'W')
+// columns of the KPI source and error segments from the per-pressure
+// matrix, without a server round trip. The server takes these columns
+// from its own matrix, so its copy of the source is not updated.
+const data = source.data;
+const m = matrix.data;
+const n = data['labels'].length;
+if (n == 0 || m['med_x'].length == 0) {
+    return;
+}
+// One matrix row of `stride` pressures per source row, in the same order
+if (m['med_x'].length != n * stride) {
+    console.warn('KPI matrix does not match the source, slider ignored.');
+    return;
+}
+
+// Pressure columns of the matrix, column 0 is zero pressure
+let p1, p2;
+if (kpi == 'L') {
+    p1 = p2 = Math.round(2 * cb_obj.value);
+} else {
+    p1 = Math.round(2 * cb_obj.value[0]);
+    p2 = Math.round(2 * cb_obj.value[1]);
+}
+
+function kpi_at(i, side) {
+    const a = i * stride + p1;
+    const b = i * stride + p2;
+    const med = m['med_' + side], size = m['size_' + side], err = m['err_' + side];
+    if (kpi == 'L') {
+        return [med[b], size[b], err[b]];
+    }
+    return [med[b] - med[a], Math.max(size[a], size[b]), err[a]];
+}
+
+for (let i = 0; i < n; i++) {
+    const x = kpi_at(i, 'x');
+    const y = kpi_at(i, 'y');
+    data[kpi + '_x'][i] = x[0];
+    data[kpi + '_y'][i] = y[0];
+    data[kpi + '_nx'][i] = x[1];
+    data[kpi + '_ny'][i] = y[1];
+    data[kpi + '_n'][i] = x[1] + y[1];
+    if (kpi == 'W') {
+        data['psa_W'][i] = (y[0] / x[0]) * data['sel'][i];
+    }
+}
+source.change.emit();
+
+// Error segments, two rows per selected material
+const e = errors.data;
+const indices = source.selected.indices;
+if (e['labels'].length != 2 * indices.length) {
+    return;
+}
+for (let j = 0; j < indices.length; j++) {
+    const x = kpi_at(indices[j], 'x');
+    const y = kpi_at(indices[j], 'y');
+    let vx = x[0], vy = y[0], ex = x[2], ey = y[2];
+    if (isNaN(vx) || isNaN(vy) || (kpi == 'L' && p2 == 0)) {
+        vx = vy = ex = ey = 0;
+    }
+    e[kpi + '_x'][2 * j] = e[kpi + '_x'][2 * j + 1] = vx;
+    e[kpi + '_y'][2 * j] = e[kpi + '_y'][2 * j + 1] = vy;
+    e[kpi + '_x0'][2 * j] = vx - ex;
+    e[kpi + '_x0'][2 * j + 1] = vx;
+    e[kpi + '_y0'][2 * j] = vy;
+    e[kpi + '_y0'][2 * j + 1] = vy - ey;
+    e[kpi + '_x1'][2 * j] = vx + ex;
+    e[kpi + '_x1'][2 * j + 1] = vx;
+    e[kpi + '_y1'][2 * j] = vy;
+    e[kpi + '_y1'][2 * j + 1] = vy + ey;
+}
+errors.change.emit();
@@ -0,0 +1,61 @@
+"""
+Windows of the cube against boolean-mask filtering of the dataset.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cube import KPICube
+from src.incremental import IncrementalKPI
+from src.statistics import filter_data, group_kpi
+
+
+def kpi_frame(rng, n=3000):
+    """KPI rows with fractional temperatures and a few materials."""
+    return pd.DataFrame({
+        'mat': rng.choice([f'mat{i}' for i in range(40)], n),
+        'ads': rng.choice(['methane', 'argon'], n),
+        'type': rng.choice(['exp', 'sim'], n),
+        't': rng.choice([77, 273, 298, 300.5, 303, 308.7, 313], n),
+        'kH': rng.random(n),
+        '1': rng.random(n),
+    }, index=[f'iso{i}' for i in range(n)])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_window_matches_mask(seed):
+    rng = np.random.default_rng(seed)
+    data = kpi_frame(rng)
+    cube = KPICube.from_frame(data)
+    for _ in range(20):
+        args = (rng.choice([None, 'exp', 'sim']),
+                float(rng.choice([77, 298, 300.5, 305])),
+                float(rng.choice([0, 0.5, 2.5, 5, 30])),
+                rng.choice(['methane', 'argon', 'xenon']))
+        expected = filter_data(data, *args)
+        assert list(filter_data(cube, *args).index) == list(expected.index)
+
+
+def test_incremental_matches_full():
+    rng = np.random.default_rng(0)
+    data = kpi_frame(rng)
+    cube = KPICube.from_frame(data)
+    state = IncrementalKPI(cube, 'methane', 'exp')
+    for t_abs, t_tol in ((298, 1), (300, 3), (303, 5), (303, 0.5), (77, 1)):
+        expected = group_kpi(filter_data(data, 'exp', t_abs, t_tol, 'methane'))
+        result = state.update(t_abs, t_tol)
+        pd.testing.assert_frame_equal(
+            result.sort_index(), expected.sort_index())
+
+
+def test_seeded_state_updates_incrementally():
+    rng = np.random.default_rng(1)
+    data = kpi_frame(rng)
+    cube = KPICube.from_frame(data)
+    state = IncrementalKPI(cube, 'methane', 'exp')
+    state.seed(300, 3, group_kpi(filter_data(data, 'exp', 300, 3, 'methane')))
+
+    expected = group_kpi(filter_data(data, 'exp', 303, 5, 'methane'))
+    result = state.update(303, 5)
+    assert state.reused > 0
+    pd.testing.assert_frame_equal(result.sort_index(), expected.sort_index())
@@ -0,0 +1,146 @@
+"""
+Accuracy of the sketched KPI against the exact KPI of the cube.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cube import KPICube
+from src.sketch import _weighted_quantile
+
+
+def cube_frame(rng, n_mats=20, max_size=300):
+    """
+    KPI rows of materials with up to `max_size` isotherms each.
+
+    Temperatures are whole degrees, so windows are made of whole bins.
+    Values are uniform, so the IQR trim removes nothing.
+    """
+    sizes = rng.integers(1, max_size, n_mats)
+    n = sizes.sum()
+    data = pd.DataFrame({
+        'mat': np.repeat([f'mat{i}' for i in range(n_mats)], sizes),
+        'ads': 'methane',
+        'type': rng.choice(['exp', 'sim'], n),
+        't': rng.integers(298, 309, n).astype(float),
+        'kH': rng.random(n),
+        '1': rng.random(n) * 10,
+    })
+    data.loc[rng.random(n) < 0.1, '1'] = np.nan
+    return data.sample(frac=1, random_state=int(rng.integers(1e6)))
+
+
+def with_outliers(data, rng, share=0.05):
+    """Replace a share of the KPI values by low outliers."""
+    data = data.copy()
+    for column in ('kH', '1'):
+        data.loc[rng.random(len(data)) < share, column] = -100.0
+    return data
+
+
+def trimmed(values):
+    """Sorted values kept by the IQR trim of `src.statistics.stats`."""
+    q3, q1 = np.percentile(values, [75, 25])
+    iqr = q3 - q1
+    return np.sort(
+        values[(q1 - 1.5 * iqr < values) | (values > q3 + 1.5 * iqr)])
+
+
+def exact_and_sketched(data, k):
+    cube = KPICube.from_frame(data)
+    cube.build_sketches(k)
+    args = (None, 303, 5, 'methane')
+    return (data, cube.select_data_single(*args),
+            cube.select_data_single(*args, engine='sketch'))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_small_cells_are_exact(seed):
+    _, exact, sketched = exact_and_sketched(
+        cube_frame(np.random.default_rng(seed), max_size=20), k=64)
+    pd.testing.assert_frame_equal(sketched, exact, check_exact=False)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_large_cells_are_within_bounds(seed):
+    k = 8
+    data, exact, sketched = exact_and_sketched(
+        cube_frame(np.random.default_rng(seed)), k=k)
+    assert list(sketched.index) == list(exact.index)
+
+    for column in ('kH', '1'):
+        # Sizes are exact, and so is the pooled standard deviation
+        np.testing.assert_array_equal(
+            sketched[(column, 'size')], exact[(column, 'size')])
+        np.testing.assert_allclose(
+            sketched[(column, 'err')], exact[(column, 'err')], rtol=1e-9)
+
+        # The median rank is off by less than 2 / k of the group size
+        for mat, med in sketched[(column, 'med')].items():
+            values = np.sort(
+                data.loc[data['mat'] == mat, column].dropna().to_numpy())
+            n = len(values)
+            rank = (n - 1) / 2
+            low = values[max(int(np.floor(rank - 2 * n / k)), 0)]
+            high = values[min(int(np.ceil(rank + 2 * n / k)), n - 1)]
+            assert low <= med <= high
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_small_cells_with_outliers_are_exact(seed):
+    rng = np.random.default_rng(seed)
+    data, exact, sketched = exact_and_sketched(
+        with_outliers(cube_frame(rng, max_size=20), rng), k=64)
+    pd.testing.assert_frame_equal(sketched, exact, check_exact=False)
+
+    # Outliers were trimmed from some materials
+    median = data.groupby('mat')['kH'].median()
+    assert (exact[('kH', 'med')] != median[exact.index]).any()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_large_cells_with_outliers_are_within_bounds(seed):
+    k = 8
+    rng = np.random.default_rng(seed)
+    data, exact, sketched = exact_and_sketched(
+        with_outliers(cube_frame(rng), rng), k=k)
+
+    for column in ('kH', '1'):
+        np.testing.assert_array_equal(
+            sketched[(column, 'size')], exact[(column, 'size')])
+
+        # The outliers are far from the trimming limit, so the median is
+        # within the rank bound of the values kept by the exact trim
+        for mat, med in sketched[(column, 'med')].items():
+            values = data.loc[data['mat'] == mat, column].dropna()
+            kept = trimmed(values.to_numpy())
+            n, rank = len(values), (len(kept) - 1) / 2
+            low = kept[max(int(np.floor(rank - 2 * n / k)), 0)]
+            high = kept[min(int(np.ceil(rank + 2 * n / k)), len(kept) - 1)]
+            assert low <= med <= high
+
+
+def test_groups_without_values():
+    # The last material has no `1` values, so its centroids run out
+    data = pd.DataFrame({
+        'mat': ['a'] * 6 + ['b'] * 2,
+        'ads': 'methane', 'type': 'exp', 't': 303.0,
+        'kH': np.arange(8.0),
+        '1': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, np.nan, np.nan],
+    })
+    _, exact, sketched = exact_and_sketched(data, k=2)
+    assert sketched.loc['b', ('1', 'size')] == 0
+    assert np.isnan(sketched.loc['b', ('1', 'med')])
+    assert sketched.loc['a', ('1', 'size')] == 6
+
+
+def test_weighted_quantile_unit_weights():
+    rng = np.random.default_rng(0)
+    codes = np.sort(rng.integers(0, 5, 200))
+    mean = np.concatenate([
+        np.sort(rng.random((codes == i).sum())) for i in range(5)])
+    for q in (0.25, 0.5, 0.75):
+        expected = [np.percentile(mean[codes == i], 100 * q)
+                    for i in range(5)]
+        np.testing.assert_allclose(
+            _weighted_quantile(codes, mean, np.ones(200), 5, q), expected)
@@ -0,0 +1,36 @@
+"""
+Snapshots are kept for a copy of their source, and dropped once it changes.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from src import snapshot
+
+
+def write_source(path, seed=0):
+    frame = pd.DataFrame({
+        'mat': ['a', 'b', 'c'], 'x': np.random.default_rng(seed).random(3)})
+    frame.to_csv(path)
+    return frame
+
+
+def test_same_content_is_accepted(tmp_path):
+    source = tmp_path / 'kpi.h5'
+    frame = write_source(source)
+    snapshot.write(tmp_path / 'snap', source, data=frame)
+
+    # As after a checkout or deployment: same bytes, another date
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    frames = snapshot.read(tmp_path / 'snap', source, ['data'])
+    assert frames is not None
+    pd.testing.assert_frame_equal(frames[0], frame)
+
+
+def test_changed_content_is_ignored(tmp_path):
+    source = tmp_path / 'kpi.h5'
+    snapshot.write(tmp_path / 'snap', source, data=write_source(source))
+    write_source(source, seed=1)
+    assert snapshot.read(tmp_path / 'snap', source, ['data']) is None
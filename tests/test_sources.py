@@ -0,0 +1,71 @@
+"""
+Patching and streaming of KPI sources when the selected materials change.
+"""
+import numpy as np
+import pytest
+
+from bokeh.models import ColumnDataSource
+
+from src.sources import align_rows, update_source
+
+
+def kpi_data(labels):
+    """Columns of materials `m<i>`, each with fixed values."""
+    values = {
+        label: np.random.default_rng(int(label[1:])).random(2)
+        for label in labels
+    }
+    return {
+        'labels': np.array(labels, dtype=object),
+        'x': np.array([values[label][0] for label in labels]),
+        'y': np.array([values[label][1] for label in labels]),
+    }
+
+
+def aligned(old, new):
+    order = align_rows(old['labels'], new['labels'])
+    return {column: values[order] for column, values in new.items()}
+
+
+def assert_same(source, data):
+    assert list(source.data) == list(data)
+    for column, values in data.items():
+        np.testing.assert_array_equal(source.data[column], values)
+
+
+def test_reordered_rows_are_unchanged():
+    labels = [f'm{i}' for i in range(20)]
+    source = ColumnDataSource(kpi_data(labels))
+    new = kpi_data(labels[::-1])
+    assert update_source(source, aligned(source.data, new)) is None
+    assert_same(source, kpi_data(labels))
+
+
+def test_added_rows_are_streamed():
+    labels = [f'm{i}' for i in range(0, 40, 2)]
+    source = ColumnDataSource(kpi_data(labels))
+    new = kpi_data(sorted(labels + ['m5', 'm11']))
+    data = aligned(source.data, new)
+    np.testing.assert_array_equal(data['labels'], labels + ['m11', 'm5'])
+    assert update_source(source, data) == 'patch'
+    assert_same(source, data)
+
+
+def test_changed_rows_are_patched():
+    labels = [f'm{i}' for i in range(20)]
+    source = ColumnDataSource(kpi_data(labels))
+    new = kpi_data(labels[::-1])
+    new['x'][:2] += 1
+    data = aligned(source.data, new)
+    assert update_source(source, data) == 'patch'
+    assert_same(source, data)
+
+
+@pytest.mark.parametrize('removed', [['m3'], ['m0', 'm19']])
+def test_removed_rows_are_replaced(removed):
+    labels = [f'm{i}' for i in range(20)]
+    source = ColumnDataSource(kpi_data(labels))
+    new = kpi_data([label for label in labels if label not in removed])
+    assert align_rows(source.data['labels'], new['labels']) is None
+    assert update_source(source, new) == 'replace'
+    assert_same(source, new)
@@ -0,0 +1,96 @@
+"""
+Parity of the vectorised KPI engine with the per-group `stats`.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.statistics import KPI_STATS, calc_kpi_vec, group_kpi, stats
+
+
+def reference_kpi(data, by='mat'):
+    """The KPI of each group and column, one `stats` call at a time."""
+    columns = data.columns.drop(by)
+    rows = {}
+    for mat, group in data.groupby(by, sort=False):
+        rows[mat] = np.concatenate(
+            [stats(group[column]).to_numpy() for column in columns])
+    return pd.DataFrame.from_dict(
+        rows, orient='index',
+        columns=pd.MultiIndex.from_product([columns, KPI_STATS]))
+
+
+def random_frame(rng, n_mats=12, n_cols=4):
+    """KPI rows of materials with 1 to 12 isotherms, NaN and outliers."""
+    frames = []
+    for i in range(n_mats):
+        size = rng.integers(1, 13)
+        values = rng.normal(rng.normal(0, 5), rng.gamma(1, 1), (size, n_cols))
+        # Outliers on both sides, which the IQR trim treats differently
+        outliers = rng.random((size, n_cols)) < 0.15
+        values[outliers] += rng.choice([-50, 50], outliers.sum())
+        # Ties, which the sorted segments must order like `stats`
+        values[rng.random((size, n_cols)) < 0.1] = 1.0
+        values[rng.random((size, n_cols)) < 0.25] = np.nan
+        frame = pd.DataFrame(values, columns=[str(c) for c in range(n_cols)])
+        frame.insert(0, 'mat', f'mat{i}')
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    # Interleave the materials, as in the dataset
+    return frame.sample(frac=1, random_state=int(rng.integers(1e6)))
+
+
+def assert_parity(data):
+    result = calc_kpi_vec(data, 'mat')
+    expected = reference_kpi(data)
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(
+        result.to_numpy(dtype=float), expected.to_numpy(dtype=float),
+        rtol=1e-12, atol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_frames(seed):
+    assert_parity(random_frame(np.random.default_rng(seed)))
+
+
+def test_group_sizes():
+    # All NaN (size 0), single value, 2 to 4 values and trimmed groups
+    data = pd.DataFrame({
+        'mat': ['a', 'b', 'b', 'c', 'c', 'c', 'd', 'd', 'd', 'd', 'd', 'd'],
+        '1': [np.nan, np.nan, 2.0, 1.0, 2.0, 9.0,
+              1.0, 1.1, 0.9, 1.0, 1.2, 30.0],
+        '2': [np.nan, 3.0, 3.0, np.nan, np.nan, 4.0,
+              -40.0, 1.0, 1.1, 0.9, 1.0, 1.2],
+    })
+    assert_parity(data)
+
+    result = calc_kpi_vec(data, 'mat')
+    assert result.loc['a', ('1', 'size')] == 0
+    assert np.isnan(result.loc['a', ('1', 'med')])
+    assert result.loc['a', ('1', 'err')] == 0
+    assert result.loc['b', ('1', 'med')] == 2.0
+
+
+def test_iqr_trim_keeps_high_outliers():
+    # `stats` keeps values above Q1 - 1.5 IQR *or* above Q3 + 1.5 IQR,
+    # so only low outliers are removed
+    data = pd.DataFrame({
+        'mat': ['a'] * 6,
+        '1': [-100.0, 1.0, 2.0, 3.0, 4.0, 100.0],
+    })
+    assert_parity(data)
+    assert calc_kpi_vec(data, 'mat').loc['a', ('1', 'med')] == 3.0
+
+
+def test_empty_frame():
+    data = pd.DataFrame({'mat': [], '1': []})
+    result = calc_kpi_vec(data, 'mat')
+    assert len(result) == 0
+    assert list(result.columns) == [('1', s) for s in KPI_STATS]
+
+
+def test_group_kpi_drops_selection_columns():
+    kpi = random_frame(np.random.default_rng(0))
+    data = kpi.assign(ads='methane', type='exp', t=303.0)
+    pd.testing.assert_frame_equal(group_kpi(data), calc_kpi_vec(kpi, 'mat'))